@@ -1,107 +1,197 @@
-import math
-import copy
+import concurrent.futures
+import json
 
-from scipy import stats as sps
+import numpy as np
+
+from ..preprocess.vocabulary import Vocabulary
 from .clusteringalgorithm import ClusteringAlgorithm
 from .spamcluster import SpamCluster
 
 
-class CCTreeNode():
+def create_feature_matrix(feature_dict):
+    """ Create an integer coded matrix from categorical feature vectors.
+
+    Each row of the matrix belongs to a mail, each column to an attribute.
+    Values are replaced by integer codes which are unique over all
+    attributes, so that a code identifies an (attribute, value) pair.
+
+    :param feature_dict: dict of mail IDs and their respective feature, either
+        plain or encoded by
+        :class:`spamclustering.preprocess.vocabulary.Vocabulary`.
+    :type feature_dict: dict
+    :return: Tuple of the list of mail IDs (row order), the code matrix, an
+        array mapping each code to its column, the list of values of each
+        code and the list of attributes. Attributes of encoded feature vectors
+        are their positions.
+    :rtype: tuple of list, :class:`numpy.ndarray`, :class:`numpy.ndarray`,
+        list, list
     """
-    TODO: Check node purity
+    mail_ids = list(feature_dict.keys())
+    if len(mail_ids) == 0:
+        return (mail_ids, np.zeros((0, 0), dtype=np.int32),
+                np.zeros(0, dtype=np.int32), [], [])
+    first_vector = feature_dict[mail_ids[0]]
+    if isinstance(first_vector, dict):
+        attributes = list(first_vector.keys())
+    else:
+        attributes = list(range(len(first_vector)))
+    data_matrix = np.zeros((len(mail_ids), len(attributes)), dtype=np.int32)
+    code_column = []
+    code_values = []
+    for column, attribute in enumerate(attributes):
+        value_codes = dict()
+        for row, mail_id in enumerate(mail_ids):
+            value = feature_dict[mail_id][attribute]
+            code = value_codes.get(value)
+            if code is None:
+                code = len(code_column)
+                value_codes[value] = code
+                code_column.append(column)
+                code_values.append(value)
+            data_matrix[row, column] = code
+    return (mail_ids, data_matrix, np.array(code_column, dtype=np.int32),
+            code_values, attributes)
+
+
+# data shared with the worker processes of a parallel CCTree build. Set once
+# per worker by _init_worker, so the data matrix is not sent with each task.
+_worker_data = None
+
+
+def _init_worker(purity_threshold, data_matrix, code_column):
+    global _worker_data
+    _worker_data = (purity_threshold, data_matrix, code_column)
 
+
+def _build_subtree(indices):
+    """ Build the complete subtree of the given rows in a worker process.
+
+    :param indices: Row indices of the subtree's root.
+    :type indices: :class:`numpy.ndarray`
+    :return: Root of the subtree.
+    :rtype: :class:`spamclustering.algorithms.cctree.CCTreeNode`
     """
-    def __init__(self, purity_threshold, data_points):
+    purity_threshold, data_matrix, code_column = _worker_data
+    node = CCTreeNode(purity_threshold, data_matrix, code_column, indices)
+    node.do_clustering()
+    return node
+
+
+class CCTreeNode():
+    """ Node of a categorical clustering tree (CCTree).
+
+    A node works on rows of a shared, integer coded data matrix (see
+    :func:`create_feature_matrix`). Only the indices of its rows are stored
+    by the node. If the node purity is below the purity threshold, the node
+    is split on the attribute of highest Shannon entropy. Each child holds
+    the rows sharing one value of this attribute.
+
+    :param purity_threshold: Nodes of lower purity are split.
+    :type purity_threshold: int or float
+    :param data_matrix: Integer coded matrix of all mails and attributes.
+    :type data_matrix: :class:`numpy.ndarray`
+    :param code_column: Maps each code of data_matrix to its column.
+    :type code_column: :class:`numpy.ndarray`
+    :param indices: Row indices of data_matrix belonging to this node.
+    :type indices: :class:`numpy.ndarray`
+    """
+    def __init__(self, purity_threshold, data_matrix, code_column, indices):
         self.children = []
-        self.data_points = data_points
         self.purity_threshold = purity_threshold
-    
+        self.data_matrix = data_matrix
+        self.code_column = code_column
+        self.indices = indices
+        self.split_attribute = None
+        # code of the split attribute shared by all rows of this node, None
+        # for the root
+        self.value_code = None
+
     def do_clustering(self):
-        # retrieve keys of attribute-value dict from the first mail
-        first_id = list(self.data_points.keys())[0]
-        list_of_attributes = self.data_points[first_id].keys()
-        # create a dict of values and their absolut frequency
-        # for each attribute
-        attribute_value_dict = dict()
-        # iterate over all attributes availble
-        for attribute in list_of_attributes:
-            value_dict = dict()
-            # process data point per attributes, this means process values of
-            # the given attribute for each data point
-            for _, data_point in self.data_points.items():
-                # the conrecte value of the chosen attribute is the value of
-                # the data_point's dict with attribute as index
-                value = data_point[attribute]
-                # frequency of occurences of the value over different data
-                # points will be counted
-                if value in value_dict.keys():
-                    value_dict[value] += 1
-                else:
-                    value_dict[value] = 1
-            # update the attribute dict with a dict {value:count}
-            # result structure looks like:
-            #   {attribute : {value1:count, value2:count, ...}, atribute2: ...}
-            attribute_value_dict[attribute] = value_dict
+        """ Build the complete subtree of this node.
+
+        Nodes are split iteratively, so the depth of the tree is not limited
+        by the recursion limit.
+        """
+        to_split = [self]
+        while len(to_split) > 0:
+            current = to_split.pop()
+            to_split.extend(current.split())
+
+    def split(self):
+        """ Split this node if its purity is too low.
+
+        :return: Newly created child nodes, an empty list if the node was not
+            split.
+        :rtype: list of :class:`spamclustering.algorithms.cctree.CCTreeNode`
+        """
+        attribute_entropies = self._calculate_attribute_entropies()
+        # node purity is the sum of the entropies of all attributes
+        node_purity = attribute_entropies.sum()
         # if node purity is to low, split on attribute with highest entropy
-        node_purity = self._calculate_node_purity(attribute_value_dict)
-        if self.purity_threshold > node_purity:
-            splitting_attribute = self._calculute_max_shannon_entropy(
-                                            attribute_value_dict)
-            if splitting_attribute == '':
-                return
-            # to split the tree, we must split on the attribute with highest
-            # entropy. All data_points sharing the same value for this
-            # attribute will be part of the same childnode. An all points with
-            # different values for this point, will be part of a different
-            # child node.
-            # Create a dict which stores information about which points belong 
-            # to which value:
-            # {value1: [point1_1, point1_2, ...], value2:[point2_1, ...], ...}
-            splitting_dict = dict()
-            #print('Splitting at attribute: ', splitting_attribute)
-            for point_id, data_point in self.data_points.items():
-                value_of_point = data_point[splitting_attribute]
-                data_point_copy = copy.deepcopy(data_point)
-                data_point_copy.pop(splitting_attribute)
-                if value_of_point in splitting_dict:
-                    splitting_dict[value_of_point] |= {point_id: 
-                                                        data_point_copy}
-                else:
-                    splitting_dict[value_of_point] = {point_id: 
-                                                      data_point_copy}
-            # create child nodes
-            for _, point_list in splitting_dict.items():
-                new_node = CCTreeNode(self.purity_threshold, point_list)
-                self.children.append(new_node)
-                new_node.do_clustering()
-        else:
-            return
+        if self.purity_threshold <= node_purity:
+            return []
+        splitting_attribute = self._calculute_max_shannon_entropy(
+                                        attribute_entropies)
+        if splitting_attribute is None:
+            return []
+        self.split_attribute = splitting_attribute
+        # to split the tree, we must split on the attribute with highest
+        # entropy. All data_points sharing the same value for this
+        # attribute will be part of the same childnode. An all points with
+        # different values for this point, will be part of a different
+        # child node.
+        for child_indices in self._split_indices(splitting_attribute):
+            new_node = CCTreeNode(self.purity_threshold,
+                                  self.data_matrix,
+                                  self.code_column,
+                                  child_indices)
+            new_node.value_code = \
+                int(self.data_matrix[child_indices[0], splitting_attribute])
+            self.children.append(new_node)
+        # the rows are now stored by the children
+        self.indices = None
+        return self.children
+
+    def _calculate_attribute_entropies(self):
+        """ Calculate the Shannon entropy of each attribute of this node.
+
+        :return: Entropy of each column of the data matrix with respect to the
+            rows of this node.
+        :rtype: :class:`numpy.ndarray` of float
+        """
+        num_of_attributes = self.data_matrix.shape[1]
+        codes, counts = np.unique(self.data_matrix[self.indices],
+                                  return_counts=True)
+        # p_vji, see definition (1) in paper
+        p_vji = counts / len(self.indices)
+        return np.bincount(self.code_column[codes],
+                           weights=-1 * p_vji * np.log(p_vji),
+                           minlength=num_of_attributes)
+
+    def _calculute_max_shannon_entropy(self, attribute_entropies):
+        """ Return the column of highest entropy, None if all attributes
+        have a single value.
+        """
+        if len(attribute_entropies) == 0:
+            return None
+        attribute = int(np.argmax(attribute_entropies))
+        if attribute_entropies[attribute] <= 0:
+            return None
+        return attribute
 
-    def _calculate_node_purity(self, attribute_value_dict):
-        node_purity = 0
-        num_of_data_points = len(self.data_points)
-        for attribute, values in attribute_value_dict.items():
-            for value, num_data_respecting_value in values.items():
-                # p_vji, see definition (1) in paper
-                p_vji = num_data_respecting_value / num_of_data_points
-                node_purity += p_vji * math.log(p_vji)
-        node_purity *= -1
-        return node_purity
-
-    def _calculute_max_shannon_entropy(self, attribute_value_dict):
-        highest_entropy = 0
-        attribute_of_highest_entropy = ''
-        total_values_count = len(attribute_value_dict)
-        for attribute, value_dict in attribute_value_dict.items():
-            # create a list to calculate entropy from
-            frequency_list = []
-            for _, value_occurence in value_dict.items():
-                frequency_list.append(value_occurence / total_values_count)
-            entropy_of_attribute = sps.entropy(frequency_list)
-            if entropy_of_attribute > highest_entropy:
-                highest_entropy = entropy_of_attribute
-                attribute_of_highest_entropy = attribute
-        return attribute_of_highest_entropy
+    def _split_indices(self, attribute):
+        """ Split the rows of this node by their value of the given column.
+
+        :param attribute: Column of the data matrix to split on.
+        :type attribute: int
+        :return: Row indices for each value of the column.
+        :rtype: list of :class:`numpy.ndarray`
+        """
+        values = self.data_matrix[self.indices, attribute]
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        boundaries = np.flatnonzero(np.diff(sorted_values)) + 1
+        return np.split(self.indices[order], boundaries)
 
     def is_leaf(self):
         """ Return true if this node is a leaf.
@@ -113,51 +203,241 @@ class CCTreeNode():
         """
         return (0 == len(self.children))
 
+    def __getstate__(self):
+        # the data matrix is shared by all nodes and known to the receiver,
+        # don't copy it when nodes are sent between processes.
+        state = self.__dict__.copy()
+        state['data_matrix'] = None
+        state['code_column'] = None
+        return state
+
+class CCTreeModel():
+    """ Split structure of a learned CCTree.
+
+    The model only keeps the split attribute and a value to child map of
+    each inner node, and the UUID of the cluster of each leaf. It can be
+    saved to and loaded from a JSON file, so new mails can be assigned to
+    the clusters of a tree learned before.
+
+    A tree learned from encoded feature vectors only knows item IDs. New
+    mails have to be encoded by the same
+    :class:`spamclustering.preprocess.vocabulary.Vocabulary`, which is
+    therefore saved and loaded together with the model if it is set.
+
+    :param nodes: Nodes of the tree, the root first. An inner node is a dict
+        with the keys 'attribute' and 'children', mapping values of the
+        attribute to positions in nodes. A leaf is a dict with the key
+        'cluster' storing the UUID of its cluster.
+    :type nodes: list of dict
+    :param vocabulary: Vocabulary that encoded the learned feature vectors,
+        None for plain feature vectors.
+    :type vocabulary: :class:`spamclustering.preprocess.vocabulary.
+        Vocabulary`
+    """
+    def __init__(self, nodes, vocabulary=None):
+        self.nodes = nodes
+        self.vocabulary = vocabulary
+
+    def assign(self, feature_vector):
+        """ Route a feature vector from the root to its leaf.
+
+        Takes one step per level of the tree.
+
+        :param feature_vector: Feature vector of the mail to assign, in the
+            same representation as the vectors the tree was learned from.
+            Plain feature vectors are encoded by self.vocabulary if it is
+            set.
+        :type feature_vector: dict or :class:`array.array` of int
+        :return: UUID of the leaf cluster, None if the mail has a value for
+            which no child exists.
+        :rtype: str
+        """
+        if len(self.nodes) == 0:
+            return None
+        if self.vocabulary is not None and isinstance(feature_vector, dict):
+            feature_vector = self.vocabulary.encode(feature_vector)
+        node = self.nodes[0]
+        while 'cluster' not in node:
+            child = node['children'].get(feature_vector[node['attribute']])
+            if child is None:
+                return None
+            node = self.nodes[child]
+        return node['cluster']
+
+    def save(self, path):
+        """ Write the model and its vocabulary to a JSON file.
+
+        :param path: Path of the file to write.
+        :type path: str
+        """
+        nodes = []
+        for node in self.nodes:
+            if 'cluster' in node:
+                nodes.append(node)
+            else:
+                nodes.append({
+                    'attribute': node['attribute'],
+                    'children': list(node['children'].items())
+                })
+        stored = {'nodes': nodes}
+        if self.vocabulary is not None:
+            stored['vocabulary'] = self.vocabulary.to_json()
+        with open(path, 'w') as fp:
+            json.dump(stored, fp)
+
+    @staticmethod
+    def load(path):
+        """ Read a model written by :meth:`save`.
+
+        :param path: Path of the file to read.
+        :type path: str
+        :return: The loaded model.
+        :rtype: :class:`spamclustering.algorithms.cctree.CCTreeModel`
+        """
+        with open(path, 'r') as fp:
+            stored = json.load(fp)
+        nodes = []
+        for node in stored['nodes']:
+            if 'cluster' in node:
+                nodes.append(node)
+            else:
+                nodes.append({
+                    'attribute': node['attribute'],
+                    'children': {value: child
+                                 for value, child in node['children']}
+                })
+        vocabulary = None
+        if 'vocabulary' in stored:
+            vocabulary = Vocabulary.from_json(stored['vocabulary'])
+        return CCTreeModel(nodes, vocabulary)
+
+
 class CcTreeClustering(ClusteringAlgorithm):
-    """ Implements context triggered piecewise hash algorithm.
+    """ Implements the categorical clustering tree (CCTree) algorithm.
 
-    The actual hashing and compare algorithms are provided by the library
-    ssdeep, developed by Jesse Kornblum. This c library is used with python
-    bindings which can be installed pypi ssdeep package. If the similarity
-    score of two hash values are greater than a threshold value, they will
-    potentially grouped in one cluster. An email is only added to the cluster
-    containing the mail with the greatest similarity score.
+    Feature vectors are converted to an integer coded matrix. Starting with
+    all mails in the root node, nodes of too low purity are split on the
+    attribute of highest entropy. The leaves of the resulting tree are the
+    clusters.
 
-    :param input_list: List of file names to process.
-    :type input_list: str or list of str
+    :param feature_dict: dict of mail IDs and their respective feature, either
+        plain or encoded by
+        :class:`spamclustering.preprocess.vocabulary.Vocabulary`.
+    :type feature_dict: dict
     :param output_path: Path to the location to which all cluster should be
         written to.
     :type output_path: str
-    :param threshold_value: Threshold of matching score. If matching score is
-        greater, the files are considered a match.
-    :type threshold_value: int or float
+    :param purity_threshold: Nodes of lower purity are split.
+    :type purity_threshold: int or float
+    :param num_of_workers: Number of processes building subtrees. With a
+        single worker the tree is built in the calling process.
+    :type num_of_workers: int
+    :param parallel_cutoff: Minimal number of mails of a node, for which the
+        subtree is built by a worker process. Smaller nodes are built
+        locally.
+    :type parallel_cutoff: int
+    :param vocabulary: Vocabulary that encoded feature_dict, kept in the
+        model, see :class:`spamclustering.algorithms.cctree.CCTreeModel`.
+    :type vocabulary: :class:`spamclustering.preprocess.vocabulary.
+        Vocabulary`
     """
 
-    def __init__(self, feature_dict, output_path, purity_threshold=50):
+    def __init__(self, feature_dict, output_path, purity_threshold=50,
+                 num_of_workers=1, parallel_cutoff=10000, vocabulary=None):
         ClusteringAlgorithm.__init__(self, feature_dict, output_path)
         self.purity_threshold = purity_threshold
+        self.num_of_workers = num_of_workers
+        self.parallel_cutoff = parallel_cutoff
+        self.vocabulary = vocabulary
+        self.model = None
+
+    def _build_parallel(self, root, data_matrix, code_column):
+        """ Build the tree, sending subtrees of large nodes to a process pool.
+
+        :param root: Root node of the tree to build.
+        :type root: :class:`spamclustering.algorithms.cctree.CCTreeNode`
+        :param data_matrix: Integer coded matrix the tree is built on.
+        :type data_matrix: :class:`numpy.ndarray`
+        :param code_column: Maps each code of data_matrix to its column.
+        :type code_column: :class:`numpy.ndarray`
+        """
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_of_workers,
+            initializer=_init_worker,
+            initargs=(self.purity_threshold, data_matrix, code_column))
+        # maps futures to the parent and position of the subtree's root
+        pending = dict()
+        with executor:
+            to_split = [root]
+            while len(to_split) > 0:
+                current = to_split.pop()
+                for position, child in enumerate(current.split()):
+                    if len(child.indices) >= self.parallel_cutoff:
+                        future = executor.submit(_build_subtree,
+                                                 child.indices)
+                        pending[future] = (current, position)
+                    else:
+                        to_split.append(child)
+            for future in concurrent.futures.as_completed(pending):
+                parent, position = pending[future]
+                # the worker builds a new root, which does not know the value
+                # it was split on
+                subtree = future.result()
+                subtree.value_code = parent.children[position].value_code
+                parent.children[position] = subtree
 
     def do_clustering(self):
         """Concrete implementation specific to the algorithm.
 
         For further details on the algorithm, read the class doc string.
+        The split structure of the tree is kept as
+        :class:`spamclustering.algorithms.cctree.CCTreeModel` in self.model.
         """
+        mail_ids, data_matrix, code_column, code_values, attributes = \
+            create_feature_matrix(self.feature_dict)
+        if len(mail_ids) == 0:
+            self.model = CCTreeModel([], self.vocabulary)
+            return
         # create ccTree and perform clustering
-        ccTree = CCTreeNode(self.purity_threshold, self.feature_dict)
-        ccTree.do_clustering()
+        ccTree = CCTreeNode(self.purity_threshold, data_matrix, code_column,
+                            np.arange(len(mail_ids)))
+        if self.num_of_workers > 1:
+            self._build_parallel(ccTree, data_matrix, code_column)
+        else:
+            ccTree.do_clustering()
 
-        #find leaves in the CCTree
-        to_visit = [ccTree]
-        leaves = []
+        # traverse the CCTree, create clusters from leaves and store the
+        # split structure of inner nodes
+        model_nodes = [None]
+        to_visit = [(ccTree, 0)]
         while len(to_visit) > 0:
-            current = to_visit.pop()
+            current, position = to_visit.pop()
             if current.is_leaf():
-                leaves.append(current)
+                cluster = SpamCluster()
+                cluster.add([mail_ids[index] for index in current.indices])
+                self.cluster_dict[cluster.uuid] = cluster
+                model_nodes[position] = {'cluster': cluster.uuid}
             else:
-                to_visit.extend(current.children)
-        
-        # create clusters form leaves
-        for leave in leaves:
-            cluster = SpamCluster()
-            cluster.add([file_id for file_id, _ in leave.data_points.items()])
-            self.cluster_dict[cluster.uuid] = cluster
\ No newline at end of file
+                children = dict()
+                for child in current.children:
+                    model_nodes.append(None)
+                    children[code_values[child.value_code]] = \
+                        len(model_nodes) - 1
+                    to_visit.append((child, len(model_nodes) - 1))
+                model_nodes[position] = {
+                    'attribute': attributes[current.split_attribute],
+                    'children': children
+                }
+        self.model = CCTreeModel(model_nodes, self.vocabulary)
+
+    def assign(self, feature_vector):
+        """ Return the cluster a new mail belongs to.
+
+        :param feature_vector: Feature vector of the new mail.
+        :type feature_vector: dict or :class:`array.array` of int
+        :return: Cluster of the leaf the mail is routed to, None if the mail
+            fits no leaf.
+        :rtype: :class:`spamclustering.algorithms.spamcluster.SpamCluster`
+        """
+        cluster_uuid = self.model.assign(feature_vector)
+        return self.cluster_dict.get(cluster_uuid)
@@ -1,9 +1,350 @@
+import concurrent.futures
+import json
+
 import ssdeep
 
 from .clusteringalgorithm import ClusteringAlgorithm
+from .hashcache import HashCache
 from .spamcluster import SpamCluster
 
 
+NGRAM_LENGTH = 7
+"""Two ssdeep signatures only score above zero if they share a substring of
+this length (the rolling window size of ssdeep)."""
+
+
+def _eliminate_sequences(signature):
+    """ Shorten runs of more than three identical characters to three, as
+    ssdeep does before comparing signatures.
+    """
+    result = []
+    run_length = 0
+    previous = None
+    for char in signature:
+        run_length = run_length + 1 if char == previous else 1
+        previous = char
+        if run_length <= 3:
+            result.append(char)
+    return ''.join(result)
+
+
+def hash_index_keys(hash_value):
+    """ Create the index keys of an ssdeep hash.
+
+    A hash 'block_size:signature1:signature2' contains a signature for the
+    block size and one for twice the block size. ssdeep only compares
+    signatures of the same block size, and only scores them above zero if
+    they share a substring of length NGRAM_LENGTH or if they are identical.
+    Therefore each n-gram of a signature is keyed together with the block
+    size of the signature. A further key marks the hash itself, so that
+    identical hashes are found even if their signatures are short.
+
+    :param hash_value: ssdeep hash.
+    :type hash_value: str
+    :return: Keys of the hash.
+    :rtype: set of tuple
+    """
+    block_size, signature1, signature2 = hash_value.split(':', 2)
+    block_size = int(block_size)
+    signature1 = _eliminate_sequences(signature1)
+    signature2 = _eliminate_sequences(signature2)
+    result = {('hash', block_size, signature1)}
+    for signature, signature_block_size in [(signature1, block_size),
+                                            (signature2, 2 * block_size)]:
+        for start in range(len(signature) - NGRAM_LENGTH + 1):
+            result.add((signature_block_size,
+                        signature[start:start + NGRAM_LENGTH]))
+    return result
+
+
+class HashIndex:
+    """ Index of ssdeep hashes to find candidates for comparison.
+
+    Hashes are stored in the order they were added. For a given hash, only
+    hashes sharing an index key (see :func:`hash_index_keys`) can have a
+    similarity score above zero. Additionally, the UUID of the cluster of
+    each mail can be stored, so the index can be saved and new mails can be
+    assigned to the clusters later on.
+    """
+    def __init__(self):
+        self.mail_ids = []
+        self.hashes = []
+        self.cluster_ids = []
+        self.postings = dict()
+
+    def add(self, mail_id, hash_value, cluster_id=None):
+        """ Add the hash of a mail to the index.
+
+        :param mail_id: ID of the mail.
+        :type mail_id: str
+        :param hash_value: ssdeep hash of the mail.
+        :type hash_value: str
+        :param cluster_id: UUID of the cluster of the mail, if known.
+        :type cluster_id: str
+        :return: Position of the mail in the index.
+        :rtype: int
+        """
+        position = len(self.hashes)
+        self.mail_ids.append(mail_id)
+        self.hashes.append(hash_value)
+        self.cluster_ids.append(cluster_id)
+        for key in hash_index_keys(hash_value):
+            self.postings.setdefault(key, []).append(position)
+        return position
+
+    def candidates(self, hash_value):
+        """ Return the positions of all hashes which might be similar.
+
+        :param hash_value: ssdeep hash to find candidates for.
+        :type hash_value: str
+        :return: Positions of candidate hashes in ascending order.
+        :rtype: list of int
+        """
+        result = set()
+        for key in hash_index_keys(hash_value):
+            result.update(self.postings.get(key, []))
+        return sorted(result)
+
+    def save(self, path):
+        """ Write mail IDs, hashes and cluster UUIDs to a JSON file.
+
+        The postings are not written, they are rebuilt by :meth:`load`.
+
+        :param path: Path of the file to write.
+        :type path: str
+        """
+        with open(path, 'w') as fp:
+            json.dump({'mail_ids': self.mail_ids,
+                       'hashes': self.hashes,
+                       'cluster_ids': self.cluster_ids}, fp)
+
+    @staticmethod
+    def load(path):
+        """ Read an index written by :meth:`save`.
+
+        :param path: Path of the file to read.
+        :type path: str
+        :return: The loaded index.
+        :rtype: :class:`spamclustering.algorithms.ctph.HashIndex`
+        """
+        with open(path, 'r') as fp:
+            stored = json.load(fp)
+        result = HashIndex()
+        for mail_id, hash_value, cluster_id in zip(stored['mail_ids'],
+                                                   stored['hashes'],
+                                                   stored['cluster_ids']):
+            result.add(mail_id, hash_value, cluster_id)
+        return result
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+def create_feature_string(feature_vector):
+    """ Concat all features to one string containing the whole feature
+    vector, so one can calculate a hash from it.
+
+    :param feature_vector: Feature vector of a mail.
+    :type feature_vector: dict of features and their respective values.
+    :return: Concatenation of all feature values.
+    :rtype: str
+    """
+    feature_string = ''
+    for _, feature_value in feature_vector.items():
+        feature_string += feature_value
+    return feature_string
+
+
+def hash_feature_string(feature_string):
+    """ Calculate the ssdeep hash of a feature string.
+
+    :param feature_string: Concatenated feature values of a mail.
+    :type feature_string: str
+    :return: ssdeep hash of the string.
+    :rtype: str
+    """
+    return ssdeep.hash(feature_string)
+
+
+def hash_feature_vector(feature_vector):
+    """ Calculate the ssdeep hash of a feature vector.
+
+    :param feature_vector: Feature vector of a mail.
+    :type feature_vector: dict of features and their respective values.
+    :return: ssdeep hash of the concatenated feature values.
+    :rtype: str
+    """
+    return hash_feature_string(create_feature_string(feature_vector))
+
+
+def find_best_match(position, hashes, hash_index, threshold):
+    """ Find the most similar hash of the hash at the given position.
+
+    :param position: Position of the hash to find the best match for.
+    :type position: int
+    :param hashes: All hashes.
+    :type hashes: list of str
+    :param hash_index: Index of all hashes. If None, the hash is compared to
+        all other hashes.
+    :type hash_index: :class:`spamclustering.algorithms.ctph.HashIndex`
+    :param threshold: Scores must be greater to be considered a match.
+    :type threshold: int or float
+    :return: Position and score of the first hash of highest score, None if
+        no score exceeds the threshold.
+    :rtype: tuple of int
+    """
+    if hash_index is None:
+        comparisons = range(len(hashes))
+    else:
+        # candidates are ordered by position, so ties of the matching score
+        # are resolved like without index
+        comparisons = hash_index.candidates(hashes[position])
+    best_match = None
+    best_score = 0
+    for comp in comparisons:
+        if comp == position:
+            continue
+        # calculate matching score
+        match_degree = ssdeep.compare(hashes[position], hashes[comp])
+        # check if score exceeds threshold and if the score is greater than
+        # the current best match
+        if (match_degree > threshold) and (match_degree > best_score):
+            best_match = comp
+            best_score = match_degree
+    if best_match is None:
+        return None
+    return (best_match, best_score)
+
+
+def find_matches(position, hashes, hash_index, threshold):
+    """ Find all hashes after the given position which match the hash at
+    this position.
+
+    Since the score of ssdeep is symmetric, calling this for each position
+    yields every matching pair exactly once.
+
+    :param position: Position of the hash to find the matches for.
+    :type position: int
+    :param hashes: All hashes.
+    :type hashes: list of str
+    :param hash_index: Index of all hashes. If None, the hash is compared to
+        all following hashes.
+    :type hash_index: :class:`spamclustering.algorithms.ctph.HashIndex`
+    :param threshold: Scores must be greater to be considered a match.
+    :type threshold: int or float
+    :return: Positions of all matching hashes.
+    :rtype: list of int
+    """
+    if hash_index is None:
+        comparisons = range(position + 1, len(hashes))
+    else:
+        comparisons = [comp for comp in hash_index.candidates(hashes[position])
+                       if comp > position]
+    return [comp for comp in comparisons
+            if ssdeep.compare(hashes[position], hashes[comp]) > threshold]
+
+
+class DisjointSet:
+    """ Union-find structure over the positions 0 to size - 1.
+
+    Uses path compression and union by size, so a sequence of operations
+    runs in nearly linear time.
+
+    :param size: Number of elements.
+    :type size: int
+    """
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.set_size = [1] * size
+
+    def find(self, element):
+        """ Return the representative of the set containing element.
+        """
+        root = element
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[element] != root:
+            self.parent[element], element = root, self.parent[element]
+        return root
+
+    def union(self, element1, element2):
+        """ Merge the sets containing element1 and element2.
+        """
+        root1 = self.find(element1)
+        root2 = self.find(element2)
+        if root1 == root2:
+            return
+        if self.set_size[root1] < self.set_size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.set_size[root1] += self.set_size[root2]
+
+    def sets(self):
+        """ Return all sets ordered by their smallest element.
+
+        :return: Sets as lists of ascending elements.
+        :rtype: list of list of int
+        """
+        result = dict()
+        for element in range(len(self.parent)):
+            result.setdefault(self.find(element), []).append(element)
+        return list(result.values())
+
+
+# data shared with the worker processes comparing hashes. Set once per
+# worker by _init_worker, so hashes and index are not sent with each task.
+_worker_data = None
+
+
+def _init_worker(hashes, hash_index, threshold):
+    global _worker_data
+    _worker_data = (hashes, hash_index, threshold)
+
+
+def _find_best_matches_of_rows(start, end):
+    """ Find the best matches of all hashes of a block of positions in a
+    worker process.
+
+    :return: Position, best match and score of each position in the block
+        having a match above the threshold.
+    :rtype: list of tuple
+    """
+    hashes, hash_index, threshold = _worker_data
+    result = []
+    for position in range(start, end):
+        best_match = find_best_match(position, hashes, hash_index, threshold)
+        if best_match is not None:
+            result.append((position, best_match[0], best_match[1]))
+    return result
+
+
+def _collect_matches(hashes, hash_index, threshold, start=0, end=None):
+    """ Collect the matching pairs of all positions from start to end.
+
+    :return: Matching pairs of positions.
+    :rtype: list of tuple
+    """
+    if end is None:
+        end = len(hashes)
+    result = []
+    for position in range(start, end):
+        for match in find_matches(position, hashes, hash_index, threshold):
+            result.append((position, match))
+    return result
+
+
+def _find_matches_of_rows(start, end):
+    """ Find all matches of the hashes of a block of positions in a worker
+    process.
+
+    :return: Matching pairs of positions.
+    :rtype: list of tuple
+    """
+    hashes, hash_index, threshold = _worker_data
+    return _collect_matches(hashes, hash_index, threshold, start, end)
+
+
 class Ctph(ClusteringAlgorithm):
     """ Implements context triggered piecewise hash algorithm.
 
@@ -14,6 +355,38 @@ class Ctph(ClusteringAlgorithm):
     potentially grouped in one cluster. An email is only added to the cluster
     containing the mail with the greatest similarity score.
 
+    If use_index is True, a mail is only compared to the mails found by a
+    :class:`spamclustering.algorithms.ctph.HashIndex` instead of all mails.
+    The resulting clusters are the same.
+
+    With more than one worker, hashes are calculated by a process pool and
+    the comparisons are split into blocks of rows_per_task mails, which are
+    processed by a process pool too. Workers only return matches above the
+    threshold.
+
+    By default, mails are processed in order and a mail is only added to the
+    cluster of its best match if that mail was processed before. Otherwise
+    a new cluster is created, so the result depends on the order of the
+    mails. If cluster_formation is 'union_find', matching pairs are
+    collected as edges and the clusters are the connected components of the
+    resulting graph, built with a :class:`DisjointSet`. The edge_policy
+    'best_match' only uses the edge between a mail and its best match,
+    'all' uses every pair above the threshold. Mails are sorted by their ID
+    first, so ties between best matches do not depend on the order of the
+    feature dict either.
+
+    After clustering, hash_index contains all mails together with the UUID of
+    their cluster. It can be saved with :meth:`save_index`. New mails are
+    assigned to the clusters by :meth:`assign_batch`, which only compares
+    them to the candidates of the index. An index saved before can be
+    loaded by :meth:`load_index` to continue a clustering without the
+    original mails.
+
+    If hash_cache_path is given, hashes are looked up in and added to a
+    :class:`spamclustering.algorithms.hashcache.HashCache` stored at this
+    path, so mails hashed by earlier runs are not hashed again. Hits and
+    misses of a run are stored in cache_hits and cache_misses.
+
     :param input_list: List of file names to process.
     :type input_list: str or list of str
     :param output_path: Path to the location to which all cluster should be
@@ -22,54 +395,293 @@ class Ctph(ClusteringAlgorithm):
     :param threshold_value: Threshold of matching score. If matching score is
         greater, the files are considered a match.
     :type threshold_value: int or float
+    :param use_index: Only compare mails sharing an index key.
+    :type use_index: bool
+    :param num_of_workers: Number of processes hashing and comparing.
+    :type num_of_workers: int
+    :param rows_per_task: Number of mails a worker compares per task.
+    :type rows_per_task: int
+    :param hash_cache_path: Path of a persistent hash cache, None to always
+        calculate all hashes.
+    :type hash_cache_path: str
+    :param hash_cache_size: Maximal number of entries of the hash cache.
+    :type hash_cache_size: int
+    :param cluster_formation: Either 'sequential' or 'union_find'.
+    :type cluster_formation: str
+    :param edge_policy: Either 'best_match' or 'all'. Only used by
+        'union_find'.
+    :type edge_policy: str
     """
+    cluster_formations = ['sequential', 'union_find']
+    edge_policies = ['best_match', 'all']
 
-    def __init__(self, feature_dict, output_path, threshold=80):
+    def __init__(self, feature_dict, output_path, threshold=80,
+                 use_index=True, num_of_workers=1, rows_per_task=500,
+                 hash_cache_path=None, hash_cache_size=1000000,
+                 cluster_formation='sequential', edge_policy='best_match'):
         ClusteringAlgorithm.__init__(self, feature_dict, output_path)
+        if cluster_formation not in self.cluster_formations:
+            raise ValueError('Unknown cluster formation: {}'.format(
+                cluster_formation))
+        if edge_policy not in self.edge_policies:
+            raise ValueError('Unknown edge policy: {}'.format(edge_policy))
         self.threshold_value = threshold
+        self.use_index = use_index
+        self.num_of_workers = num_of_workers
+        self.rows_per_task = rows_per_task
+        self.hash_cache_path = hash_cache_path
+        self.hash_cache_size = hash_cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cluster_formation = cluster_formation
+        self.edge_policy = edge_policy
+        self.hash_index = None
+
+    def _hash_strings(self, feature_strings):
+        """ Calculate the ssdeep hash of each feature string.
+
+        :param feature_strings: Strings to hash.
+        :type feature_strings: list of str
+        :return: Hashes in the order of feature_strings.
+        :rtype: list of str
+        """
+        if (self.num_of_workers <= 1) or (len(feature_strings) == 0):
+            return [hash_feature_string(feature_string)
+                    for feature_string in feature_strings]
+        chunk_size = max(1, len(feature_strings) // (4 * self.num_of_workers))
+        with concurrent.futures.ProcessPoolExecutor(
+                self.num_of_workers) as executor:
+            return list(executor.map(hash_feature_string, feature_strings,
+                                     chunksize=chunk_size))
+
+    def _calculate_hashes(self, feature_vectors):
+        """ Calculate the ssdeep hash of each feature vector.
+
+        Hashes found in the hash cache are not calculated again. New hashes
+        are added to the cache.
+
+        :param feature_vectors: Feature vectors to hash.
+        :type feature_vectors: list of dict
+        :return: Hashes in the order of feature_vectors.
+        :rtype: list of str
+        """
+        feature_strings = [create_feature_string(feature_vector)
+                           for feature_vector in feature_vectors]
+        if self.hash_cache_path is None:
+            return self._hash_strings(feature_strings)
+        with HashCache(self.hash_cache_path,
+                       self.hash_cache_size) as hash_cache:
+            digests = [HashCache.digest(feature_string)
+                       for feature_string in feature_strings]
+            cached_hashes = hash_cache.lookup(digests)
+            hashes = [cached_hashes.get(digest) for digest in digests]
+            missing = [position for position, hash_value
+                       in enumerate(hashes) if hash_value is None]
+            new_hashes = self._hash_strings([feature_strings[position]
+                                             for position in missing])
+            for position, hash_value in zip(missing, new_hashes):
+                hashes[position] = hash_value
+            hash_cache.store({digests[position]: hashes[position]
+                              for position in missing})
+            self.cache_hits = hash_cache.hits
+            self.cache_misses = hash_cache.misses
+        return hashes
+
+    def _find_best_matches(self, hashes, hash_index):
+        """ Find the best match above the threshold of each hash.
+
+        :param hashes: Hashes of all mails.
+        :type hashes: list of str
+        :param hash_index: Index of all hashes, None to compare all pairs.
+        :type hash_index: :class:`spamclustering.algorithms.ctph.HashIndex`
+        :return: Dict of positions and position and score of their best
+            match. Positions without a match are missing.
+        :rtype: dict of int and tuple
+        """
+        result = dict()
+        if self.num_of_workers <= 1:
+            for position in range(len(hashes)):
+                best_match = find_best_match(position, hashes, hash_index,
+                                             self.threshold_value)
+                if best_match is not None:
+                    result[position] = best_match
+            return result
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_of_workers,
+            initializer=_init_worker,
+            initargs=(hashes, hash_index, self.threshold_value))
+        with executor:
+            jobs = []
+            for start in range(0, len(hashes), self.rows_per_task):
+                end = min(start + self.rows_per_task, len(hashes))
+                jobs.append(executor.submit(_find_best_matches_of_rows,
+                                            start, end))
+            for job in concurrent.futures.as_completed(jobs):
+                for position, best_match, score in job.result():
+                    result[position] = (best_match, score)
+        return result
+
+    def _find_all_matches(self, hashes, hash_index):
+        """ Find all pairs of hashes scoring above the threshold.
+
+        :param hashes: Hashes of all mails.
+        :type hashes: list of str
+        :param hash_index: Index of all hashes, None to compare all pairs.
+        :type hash_index: :class:`spamclustering.algorithms.ctph.HashIndex`
+        :return: Matching pairs of positions.
+        :rtype: list of tuple
+        """
+        if self.num_of_workers <= 1:
+            return _collect_matches(hashes, hash_index, self.threshold_value)
+        result = []
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_of_workers,
+            initializer=_init_worker,
+            initargs=(hashes, hash_index, self.threshold_value))
+        with executor:
+            jobs = []
+            for start in range(0, len(hashes), self.rows_per_task):
+                end = min(start + self.rows_per_task, len(hashes))
+                jobs.append(executor.submit(_find_matches_of_rows,
+                                            start, end))
+            for job in concurrent.futures.as_completed(jobs):
+                result += job.result()
+        return result
+
+    def _form_clusters_union_find(self, mail_ids, hashes, hash_index):
+        """ Create the clusters from the connected components of all edges.
+
+        The clusters do not depend on the order in which edges are found.
+        """
+        if self.edge_policy == 'all':
+            edges = self._find_all_matches(hashes, hash_index)
+        else:
+            edges = [(position, best_match[0]) for position, best_match
+                     in self._find_best_matches(hashes, hash_index).items()]
+        disjoint_set = DisjointSet(len(mail_ids))
+        for position1, position2 in edges:
+            disjoint_set.union(position1, position2)
+        for positions in disjoint_set.sets():
+            cluster = SpamCluster()
+            for position in positions:
+                cluster.add(mail_ids[position])
+            self.cluster_dict[cluster.uuid] = cluster
 
     def do_clustering(self):
         """Concrete implementation specific to the algorithm.
 
         For further details on the algorithm, read the class doc string.
         """
-        # dict to store hash values of each file
-        hash_dict = {}
+        mail_ids = list(self.feature_dict.keys())
+        if self.cluster_formation == 'union_find':
+            # ties between best matches are resolved by position, so fix
+            # the positions independently of the order of the dict
+            mail_ids.sort()
         # calculate hash value for each file
-        for mail_id, feature_vector in self.feature_dict.items():
-            # concat all features to one string containing the whole feature 
-            # vector so one can calculate a hash from it
-            feature_string = ''
-            for _, feature_value in feature_vector.items():
-                feature_string += feature_value
-            hash_dict[mail_id] = ssdeep.hash(feature_string)
-
-        # use a dict to store which file belongs to which cluster
-        file_cluster_dict = {}
+        hashes = self._calculate_hashes([self.feature_dict[mail_id]
+                                         for mail_id in mail_ids])
+
+        hash_index = None
+        if self.use_index:
+            hash_index = HashIndex()
+            for mail_id, hash_value in zip(mail_ids, hashes):
+                hash_index.add(mail_id, hash_value)
+
+        if self.cluster_formation == 'union_find':
+            self._form_clusters_union_find(mail_ids, hashes, hash_index)
+        else:
+            self._form_clusters_sequential(mail_ids, hashes, hash_index)
+
+        # keep an index of all mails and their clusters for assign_batch
+        if hash_index is None:
+            hash_index = HashIndex()
+            for mail_id, hash_value in zip(mail_ids, hashes):
+                hash_index.add(mail_id, hash_value)
+        mail_cluster = dict()
+        for _, cluster in self.cluster_dict.items():
+            for mail_id in cluster.cluster_members:
+                mail_cluster[mail_id] = cluster.uuid
+        hash_index.cluster_ids = [mail_cluster[mail_id]
+                                  for mail_id in hash_index.mail_ids]
+        self.hash_index = hash_index
+
+    def _form_clusters_sequential(self, mail_ids, hashes, hash_index):
+        """ Add each mail to the cluster of its best match if this match was
+        processed before, else create a new cluster.
+        """
         # perform the clustering, comparing each file to all others
-        for current in hash_dict.keys():
-            # we need to somehow store the best matching email. Therefore we
-            # safe the filename together with the matching score.
-            best_match = ('', 0)
-            for comp in hash_dict.keys():
-                if current != comp:
-                    # calculate matching score
-                    match_degree = ssdeep.compare(hash_dict[current],
-                                                  hash_dict[comp])
-                    # check if score exceeds threshold and if the score is
-                    # greater than the current best match
-                    if (match_degree > self.threshold_value) and \
-                       (match_degree > best_match[1]):
-                        best_match = (comp, match_degree)
+        best_matches = self._find_best_matches(hashes, hash_index)
 
+        # use a list to store which file belongs to which cluster
+        position_cluster = [None] * len(mail_ids)
+        for position, mail_id in enumerate(mail_ids):
             cluster = None
+            best_match = best_matches.get(position)
             # add the current file either to an existing cluster (that with the
             # best match) or create a new one.
-            if best_match[0] in file_cluster_dict.keys():
-                cluster = file_cluster_dict[best_match[0]]
-                cluster.add(current)
+            if (best_match is not None) and \
+               (position_cluster[best_match[0]] is not None):
+                cluster = position_cluster[best_match[0]]
+                cluster.add(mail_id)
             else:
                 cluster = SpamCluster()
-                cluster.add(current)
+                cluster.add(mail_id)
+                self.cluster_dict[cluster.uuid] = cluster
+            position_cluster[position] = cluster
+
+    def save_index(self, path):
+        """ Write the hash index of all clustered mails to a JSON file.
+
+        :param path: Path of the file to write.
+        :type path: str
+        """
+        self.hash_index.save(path)
+
+    def load_index(self, path):
+        """ Continue a clustering from a hash index saved before.
+
+        :param path: Path of the file written by :meth:`save_index`.
+        :type path: str
+        """
+        self.hash_index = HashIndex.load(path)
+
+    def assign_batch(self, feature_dict):
+        """ Assign new mails to the clusters of the hash index.
+
+        Each mail is only compared to the candidates of the index and joins
+        the cluster of its best match above the threshold. Mails without a
+        match create a new cluster. Each mail is appended to the index, so
+        later mails of the batch can match it as well. The
+        clusters of the new mails are added to cluster_dict.
+
+        :param feature_dict: Feature vectors of the new mails.
+        :type feature_dict: dict of mail IDs and their feature vectors
+        :return: Dict of the new mail IDs and the UUID of their cluster.
+        :rtype: dict of str and str
+        """
+        if self.hash_index is None:
+            self.hash_index = HashIndex()
+        mail_ids = list(feature_dict.keys())
+        hashes = self._calculate_hashes([feature_dict[mail_id]
+                                         for mail_id in mail_ids])
+        result = dict()
+        for mail_id, hash_value in zip(mail_ids, hashes):
+            position = self.hash_index.add(mail_id, hash_value)
+            best_match = find_best_match(position, self.hash_index.hashes,
+                                         self.hash_index,
+                                         self.threshold_value)
+            if best_match is None:
+                cluster = SpamCluster()
                 self.cluster_dict[cluster.uuid] = cluster
-            file_cluster_dict[current] = cluster
+            else:
+                cluster_id = self.hash_index.cluster_ids[best_match[0]]
+                cluster = self.cluster_dict.get(cluster_id)
+                if cluster is None:
+                    # cluster of a loaded index, not known in this run yet
+                    cluster = SpamCluster()
+                    cluster.uuid = cluster_id
+                    self.cluster_dict[cluster_id] = cluster
+            cluster.add(mail_id)
+            self.hash_index.cluster_ids[position] = cluster.uuid
+            result[mail_id] = cluster.uuid
+        return result
@@ -1,49 +1,143 @@
-import math
-import copy
-
-from scipy import stats as sps
 from .clusteringalgorithm import ClusteringAlgorithm
 from .spamcluster import SpamCluster
+from ..preprocess.vocabulary import feature_values
 
 
 class FPTreeNode():
-    """
-    TODO: Check node purity
+    """ Node of a frequent pattern tree (FPTree).
+
+    Each node represents a feature (item) on the path from the root and
+    counts the feature vectors sharing this path. Nodes of the same feature
+    are chained by node links. The root keeps a header table with the first
+    node of each chain and the support of each feature.
 
+    :param min_size: Minimal support of a frequent itemset.
+    :type min_size: int
+    :param root: True if the node is the root of a tree.
+    :type root: bool
     """
     def __init__(self, min_size, root=False):
-        self.children = []
+        # children are stored by their feature for constant time lookup
+        self.children = dict()
         self.parent = None
-        self.siblings = []
         self.feature = ''
         self.is_root = root
         self.id_list = []
         self.min_size = min_size
+        self.count = 0
+        # next node of the same feature in the tree
+        self.node_link = None
+        # only used by the root: first node and support of each feature
+        self.header_table = dict()
+        self.item_support = dict()
 
     def add_node(self, node):
-        self.children.append(node)
+        self.children[node.feature] = node
         node.parent = self
 
     def search_feature(self, feature):
-        result = None
-        for child in self.children:
-            if child.feature == feature:
-                result = child 
-        return result
+        return self.children.get(feature)
+
+    def add_feature_vector(self, mail_id, feature_vector, count=1):
+        """ Insert a sorted feature vector into the tree of this root.
 
-    def add_feature_vector(self, mail_id, feature_vector):
-        feature = feature_vector.pop(0)
-        if len(feature_vector) == 0:
-            self.id_list.append(mail_id)
-            return
-        else:
-            feature_child = self.search_feature(feature)
+        Each feature of the vector is a step on the path from the root. The
+        count of each node on the path is increased by count and the mail ID
+        is stored at the last node of the path. The vector is not modified.
+
+        :param mail_id: ID of the mail the feature vector belongs to. None if
+            no ID should be stored.
+        :type mail_id: str
+        :param feature_vector: Feature values sorted by their frequency.
+        :type feature_vector: list
+        :param count: Number of feature vectors this vector stands for.
+        :type count: int
+        """
+        node = self
+        for feature in feature_vector:
+            feature_child = node.children.get(feature)
             if feature_child is None:
-                new_child = FPTreeNode(self.min_size)
-                new_child.feature = feature
-                self.add_node(new_child)
-                feature_child = new_child
-            feature_child.add_feature_vector(mail_id, feature_vector)
+                feature_child = FPTreeNode(node.min_size)
+                feature_child.feature = feature
+                node.add_node(feature_child)
+                # prepend the new node to the node links of the feature
+                feature_child.node_link = self.header_table.get(feature)
+                self.header_table[feature] = feature_child
+            feature_child.count += count
+            self.item_support[feature] = \
+                self.item_support.get(feature, 0) + count
+            node = feature_child
+        if mail_id is not None:
+            node.id_list.append(mail_id)
+
+    def prefix_path(self):
+        """ Features on the path from the root to the parent of this node.
+
+        :return: Features ordered from the root downwards.
+        :rtype: list
+        """
+        result = []
+        node = self.parent
+        while (node is not None) and (not node.is_root):
+            result.append(node.feature)
+            node = node.parent
+        result.reverse()
+        return result
+
+    def conditional_tree(self, feature):
+        """ Create the conditional FPTree of a feature of this tree.
+
+        The conditional pattern base of the feature consists of the prefix
+        paths of all nodes of the feature, weighted with the node's count.
+        Features of the pattern base which are not frequent are pruned.
+
+        :param feature: Feature to create the conditional tree for.
+        :return: Root of the conditional tree.
+        :rtype: :class:`spamclustering.algorithms.fptree.FPTreeNode`
+        """
+        pattern_base = []
+        conditional_support = dict()
+        node = self.header_table.get(feature)
+        while node is not None:
+            path = node.prefix_path()
+            if len(path) > 0:
+                pattern_base.append((path, node.count))
+                for path_feature in path:
+                    conditional_support[path_feature] = \
+                        conditional_support.get(path_feature, 0) + node.count
+            node = node.node_link
+        result = FPTreeNode(self.min_size, root=True)
+        for path, count in pattern_base:
+            # paths keep the order of this tree, which is a valid order for
+            # the conditional tree too
+            frequent_path = [path_feature for path_feature in path
+                             if conditional_support[path_feature]
+                             >= self.min_size]
+            if len(frequent_path) > 0:
+                result.add_feature_vector(None, frequent_path, count)
+        return result
+
+    def mine_frequent_itemsets(self, suffix, result):
+        """ Find all frequent itemsets of this tree using FP-growth.
+
+        :param suffix: Itemset this (conditional) tree was created for. Use
+            an empty frozenset for the complete tree.
+        :type suffix: frozenset
+        :param result: Dict to store each frequent itemset and its support.
+        :type result: dict of frozenset and int
+        """
+        # process features from the least frequent one
+        features = sorted(self.item_support.keys(),
+                          key=lambda h: self.item_support[h])
+        for feature in features:
+            support = self.item_support[feature]
+            if support < self.min_size:
+                continue
+            itemset = suffix | {feature}
+            result[itemset] = support
+            conditional_tree = self.conditional_tree(feature)
+            if not conditional_tree.is_leaf():
+                conditional_tree.mine_frequent_itemsets(itemset, result)
 
     def is_leaf(self):
         """ Return true if this node is a leaf.
@@ -56,65 +150,145 @@ class FPTreeNode():
         return (0 == len(self.children))
 
 class FPTreeClustering(ClusteringAlgorithm):
-    """ Implements context triggered piecewise hash algorithm.
+    """ Implements clustering based on frequent itemsets found by FP-growth.
 
-    The actual hashing and compare algorithms are provided by the library
-    ssdeep, developed by Jesse Kornblum. This c library is used with python
-    bindings which can be installed pypi ssdeep package. If the similarity
-    score of two hash values are greater than a threshold value, they will
-    potentially grouped in one cluster. An email is only added to the cluster
-    containing the mail with the greatest similarity score.
+    The feature values of a mail are viewed as items. Items occurring in
+    fewer than min_size mails are pruned before the FPTree is built. All
+    frequent itemsets, which are itemsets of a support of at least min_size,
+    are mined from the tree. Starting with the largest and most frequent
+    itemset, each itemset contained by at least min_size mails which are not
+    clustered yet becomes a cluster of these mails. All remaining mails form a
+    cluster of their own.
 
-    :param input_list: List of file names to process.
-    :type input_list: str or list of str
+    :param feature_dict: dict of mail IDs and their respective feature, either
+        plain or encoded by
+        :class:`spamclustering.preprocess.vocabulary.Vocabulary`.
+    :type feature_dict: dict
     :param output_path: Path to the location to which all cluster should be
         written to.
     :type output_path: str
-    :param threshold_value: Threshold of matching score. If matching score is
-        greater, the files are considered a match.
-    :type threshold_value: int or float
+    :param min_size: Minimal support of a frequent itemset.
+    :type min_size: int
     """
 
     def __init__(self, feature_dict, output_path, min_size=5):
         ClusteringAlgorithm.__init__(self, feature_dict, output_path)
         self.min_size = min_size
+        self.item_rank = dict()
+        self.frequent_itemsets = dict()
 
-    def do_clustering(self):
-        """Concrete implementation specific to the algorithm.
+    def build_tree(self):
+        """ Build the FPTree of all feature vectors.
 
-        For further details on the algorithm, read the class doc string.
+        Only frequent items are added to the tree. The items of each vector
+        are ordered by descending support, self.item_rank stores this order.
+
+        :return: Root of the tree.
+        :rtype: :class:`spamclustering.algorithms.fptree.FPTreeNode`
         """
-        # create FPTree and perform clustering
         fp_tree = FPTreeNode(self.min_size, root=True)
 
-        # count occurence of features
+        # count occurence of features. Distinct values are taken in order of
+        # their occurence, not in hash order, so items of equal support are
+        # ranked the same way in every run.
         item_dict = dict()
         for _, feature_vector in self.feature_dict.items():
-            for feature, feature_value in feature_vector.items():
-                if feature_value in item_dict.keys():
-                    item_dict[feature_value] += 1
-                else:
-                    item_dict[feature_value] = 0
+            for feature_value in dict.fromkeys(feature_values(feature_vector)):
+                item_dict[feature_value] = item_dict.get(feature_value, 0) + 1
+
+        # rank frequent items by number of occurence, ties by first occurence
+        frequent_items = [item for item, support in item_dict.items()
+                          if support >= self.min_size]
+        frequent_items.sort(key=lambda h: -item_dict[h])
+        self.item_rank = {item: rank
+                          for rank, item in enumerate(frequent_items)}
 
         # add the feature vector of each mail to the tree
         for mail_id, feature_vector in self.feature_dict.items():
-            # sort feature values by number of occurence
-            new_vec = list(feature_vector.values())
-            new_vec.sort(key = (lambda h: item_dict[h]), reverse=True)
+            new_vec = self._frequent_items(feature_vector)
             fp_tree.add_feature_vector(mail_id, new_vec)
+        return fp_tree
+
+    def _frequent_items(self, feature_vector):
+        """ Return the distinct frequent items of a feature vector, ordered
+        by descending support.
+        """
+        items = dict.fromkeys(feature_values(feature_vector))
+        result = [item for item in items if item in self.item_rank]
+        result.sort(key=lambda h: self.item_rank[h])
+        return result
+
+    def _itemset_members(self, fp_tree):
+        """ Find the mails containing each frequent itemset.
 
-        #find leaves in the FpTree
-        to_visit = fp_tree.children
-        leaves = []
+        Mails sharing the same frequent items end at the same node of the
+        FPTree. For each such node, only the frequent itemsets whose least
+        frequent item is on the path of the node are checked, instead of
+        every combination of the items on the path.
+
+        :param fp_tree: Root of the FPTree of all feature vectors.
+        :type fp_tree: :class:`spamclustering.algorithms.fptree.FPTreeNode`
+        :return: Dict of frequent itemsets and the mail IDs containing them.
+        :rtype: dict of frozenset and list of str
+        """
+        # frequent itemsets by their least frequent item
+        itemsets_by_item = dict()
+        for itemset in self.frequent_itemsets:
+            last_item = max(itemset, key=lambda h: self.item_rank[h])
+            itemsets_by_item.setdefault(last_item, []).append(itemset)
+        result = dict()
+        to_visit = list(fp_tree.children.values())
         while len(to_visit) > 0:
             current = to_visit.pop()
-            if current.is_leaf():
-                leaves.append(current)
-            else:
-                to_visit.extend(current.children)
+            to_visit.extend(current.children.values())
+            if len(current.id_list) == 0:
+                continue
+            items = current.prefix_path() + [current.feature]
+            path_items = set(items)
+            for item in items:
+                for itemset in itemsets_by_item.get(item, []):
+                    if itemset <= path_items:
+                        result.setdefault(itemset, []).extend(
+                            current.id_list)
+        return result
+
+    def _itemset_order(self, itemset):
+        """ Sort key of itemsets, larger and more frequent itemsets first.
+        Ties are broken by the ranks of the items, so the order does not
+        depend on hashing.
+        """
+        return (-len(itemset), -self.frequent_itemsets[itemset],
+                sorted(self.item_rank[item] for item in itemset))
+
+    def do_clustering(self):
+        """Concrete implementation specific to the algorithm.
 
-        # create clusters form leaves
-        for leave in leaves:
+        For further details on the algorithm, read the class doc string.
+        """
+        fp_tree = self.build_tree()
+        self.frequent_itemsets = dict()
+        fp_tree.mine_frequent_itemsets(frozenset(), self.frequent_itemsets)
+
+        # visit itemsets from the largest and most frequent one. An itemset
+        # becomes a cluster if at least min_size mails containing it are not
+        # part of a cluster yet.
+        itemset_members = self._itemset_members(fp_tree)
+        itemsets = list(itemset_members.keys())
+        itemsets.sort(key=self._itemset_order)
+        clustered = set()
+        for itemset in itemsets:
+            members = [mail_id for mail_id in itemset_members[itemset]
+                       if mail_id not in clustered]
+            if len(members) < self.min_size:
+                continue
             cluster = SpamCluster()
-            cluster.add(leave.id_list)
-            self.cluster_dict[cluster.uuid] = cluster
\ No newline at end of file
+            cluster.add(members)
+            clustered |= set(members)
+            self.cluster_dict[cluster.uuid] = cluster
+
+        # all other mails form a cluster of their own
+        for mail_id in self.feature_dict.keys():
+            if mail_id not in clustered:
+                cluster = SpamCluster()
+                cluster.add(mail_id)
+                self.cluster_dict[cluster.uuid] = cluster
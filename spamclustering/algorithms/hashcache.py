@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import time
+
+
+class HashCache:
+    """ Persistent cache of ssdeep hashes stored in a SQLite database.
+
+    Hashes are keyed by a cheap digest (BLAKE2b, 16 bytes) of the hashed
+    feature string. Each entry stores when it was used last. If the cache
+    grows beyond max_entries, the least recently used entries are evicted.
+    Hits and misses of all lookups are counted.
+
+    :param path: Path of the SQLite database file. Created if missing.
+    :type path: str
+    :param max_entries: Maximal number of entries kept in the cache.
+    :type max_entries: int
+    """
+    # SQLite limits the number of parameters of a single statement
+    lookup_chunk_size = 500
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'digest BLOB PRIMARY KEY, '
+            'hash TEXT NOT NULL, '
+            'last_used REAL NOT NULL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS hashes_last_used '
+            'ON hashes (last_used)')
+        self.connection.commit()
+
+    @staticmethod
+    def digest(feature_string):
+        """ Create the cache key of a feature string.
+
+        :param feature_string: String which is hashed by ssdeep.
+        :type feature_string: str
+        :return: Digest of the string.
+        :rtype: bytes
+        """
+        return hashlib.blake2b(
+            feature_string.encode('utf-8', 'surrogatepass'),
+            digest_size=16).digest()
+
+    def lookup(self, digests):
+        """ Return the cached hashes of the given digests.
+
+        Updates the usage time of all found entries.
+
+        :param digests: Digests to look up.
+        :type digests: list of bytes
+        :return: Dict of found digests and their ssdeep hash.
+        :rtype: dict of bytes and str
+        """
+        result = dict()
+        unique_digests = list(set(digests))
+        for start in range(0, len(unique_digests), self.lookup_chunk_size):
+            chunk = unique_digests[start:start + self.lookup_chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.connection.execute(
+                'SELECT digest, hash FROM hashes WHERE digest IN ({})'.format(
+                    placeholders), chunk)
+            for digest, hash_value in rows:
+                result[digest] = hash_value
+        now = time.time()
+        self.connection.executemany(
+            'UPDATE hashes SET last_used = ? WHERE digest = ?',
+            [(now, digest) for digest in result.keys()])
+        self.connection.commit()
+        num_of_hits = sum(1 for digest in digests if digest in result)
+        self.hits += num_of_hits
+        self.misses += len(digests) - num_of_hits
+        return result
+
+    def store(self, entries):
+        """ Add hashes to the cache and evict entries if it grew too large.
+
+        :param entries: Dict of digests and their ssdeep hash.
+        :type entries: dict of bytes and str
+        """
+        now = time.time()
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO hashes (digest, hash, last_used) '
+            'VALUES (?, ?, ?)',
+            [(digest, hash_value, now)
+             for digest, hash_value in entries.items()])
+        self.connection.commit()
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries exceeding max_entries.
+        """
+        surplus = len(self) - self.max_entries
+        if surplus > 0:
+            self.connection.execute(
+                'DELETE FROM hashes WHERE digest IN ('
+                'SELECT digest FROM hashes ORDER BY last_used ASC LIMIT ?)',
+                (surplus,))
+            self.connection.commit()
+
+    def close(self):
+        """ Close the underlying database connection.
+        """
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        return 'Hash cache {}: {} entries, {} hits, {} misses'.format(
+            self.path, len(self), self.hits, self.misses)
@@ -0,0 +1,140 @@
+import email.message
+import random
+
+
+CATEGORICAL_FEATURES = [
+    'payload_types',
+    'uri_amount',
+    'schemes_string',
+    'hosts_string',
+    'total_attachment_size',
+    'attachment_fil_extensions'
+]
+"""Feature keys used for generated feature vectors. Matches the keys returned
+by :meth:`spamclustering.preprocess.featureselector.FeatureSelector.
+get_categorigal_features`."""
+
+
+def generate_feature_dict(num_of_mails, num_of_campaigns, noise=0.1,
+                          seed=0):
+    """ Generate a synthetic feature dict for benchmarking purposes.
+
+    Each mail is drawn from one of `num_of_campaigns` campaign prototypes. A
+    prototype assigns one value to each categorical feature. With probability
+    `noise` a feature of a mail is replaced by a random value, so that
+    campaigns are not perfectly separable.
+
+    :param num_of_mails: Number of feature vectors to generate.
+    :type num_of_mails: int
+    :param num_of_campaigns: Number of distinct campaign prototypes.
+    :type num_of_campaigns: int
+    :param noise: Probability of replacing a feature value by a random one.
+    :type noise: float
+    :param seed: Seed of the random generator, same seeds create same dicts.
+    :type seed: int
+    :return: Dict of mail IDs and their respective feature vector.
+    :rtype: dict of str and dict
+    """
+    rnd = random.Random(seed)
+    prototypes = []
+    for _ in range(max(1, num_of_campaigns)):
+        prototypes.append({
+            feature: '{}_{}'.format(feature, rnd.randrange(50))
+            for feature in CATEGORICAL_FEATURES
+        })
+    result = dict()
+    for mail_num in range(num_of_mails):
+        prototype = prototypes[rnd.randrange(len(prototypes))]
+        feature_vector = dict()
+        for feature, value in prototype.items():
+            if rnd.random() < noise:
+                value = '{}_{}'.format(feature, rnd.randrange(1000))
+            feature_vector[feature] = value
+        result['mail_{}.eml'.format(mail_num)] = feature_vector
+    return result
+
+
+def generate_text_feature_dict(num_of_mails, num_of_campaigns, seed=0):
+    """ Generate a synthetic feature dict of text features.
+
+    Each campaign has a template text drawn from a small vocabulary. The text
+    of a mail is the template of its campaign with a few words replaced, so
+    that hashes of mails of the same campaign are similar but not equal.
+
+    :param num_of_mails: Number of feature vectors to generate.
+    :type num_of_mails: int
+    :param num_of_campaigns: Number of distinct campaign templates.
+    :type num_of_campaigns: int
+    :param seed: Seed of the random generator, same seeds create same dicts.
+    :type seed: int
+    :return: Dict of mail IDs and their respective feature vector with the
+        keys 'subject' and 'html_payloads'.
+    :rtype: dict of str and dict
+    """
+    rnd = random.Random(seed)
+    words = ['word{}'.format(num) for num in range(3000)]
+    templates = []
+    for _ in range(max(1, num_of_campaigns)):
+        templates.append([rnd.choice(words)
+                          for _ in range(rnd.randrange(100, 600))])
+    result = dict()
+    for mail_num in range(num_of_mails):
+        text = list(templates[rnd.randrange(len(templates))])
+        for _ in range(rnd.randrange(0, 15)):
+            text[rnd.randrange(len(text))] = rnd.choice(words)
+        result['mail_{}.eml'.format(mail_num)] = {
+            'subject': 'subject{}'.format(rnd.randrange(5)),
+            'html_payloads': ' '.join(text)
+        }
+    return result
+
+
+def generate_mails(num_of_mails, num_of_campaigns, seed=0):
+    """ Generate synthetic raw mails for benchmarking parsing and payload
+    extraction.
+
+    Each campaign has a template text. A mail is a multipart message with
+    the text of its campaign as quoted-printable plain text and as base64
+    encoded HTML. Some mails additionally carry a small PNG attachment.
+
+    :param num_of_mails: Number of mails to generate.
+    :type num_of_mails: int
+    :param num_of_campaigns: Number of distinct campaign templates.
+    :type num_of_campaigns: int
+    :param seed: Seed of the random generator, same seeds create same mails.
+    :type seed: int
+    :return: Dict of mail IDs and the raw bytes of the respective mail.
+    :rtype: dict of str and bytes
+    """
+    rnd = random.Random(seed)
+    text_features = generate_text_feature_dict(num_of_mails,
+                                               num_of_campaigns, seed)
+    result = dict()
+    for mail_id, feature_vector in text_features.items():
+        words = feature_vector['html_payloads'].split(' ')
+        lines = [' '.join(words[start:start + 12])
+                 for start in range(0, len(words), 12)]
+        message = email.message.EmailMessage()
+        message['From'] = 'sender{}@example.com'.format(rnd.randrange(100))
+        message['To'] = 'user{}@example.org'.format(rnd.randrange(1000))
+        message['Subject'] = feature_vector['subject']
+        message.set_content('\n'.join(lines) + '\nBest offers für you\n',
+                            cte='quoted-printable')
+        html = '<html><body>{}<a href="http://shop{}.example.com/{}">' \
+               'Click</a></body></html>\n'.format(
+                   '<br>\n'.join(lines), rnd.randrange(20), mail_id)
+        message.add_alternative(html, subtype='html', cte='base64')
+        if rnd.random() < 0.3:
+            message.add_attachment(bytes(rnd.randrange(256)
+                                         for _ in range(2000)),
+                                   maintype='image', subtype='png',
+                                   filename='image.png')
+        # like most mail clients, only write MIME-Version to the top level.
+        # Boundaries are set explicitly, the generator would draw random ones
+        for part_num, part in enumerate(message.walk()):
+            if part is not message:
+                del part['MIME-Version']
+            if part.is_multipart():
+                part.set_boundary('=={}_{}=='.format(mail_id, part_num))
+        result[mail_id] = message.as_bytes()
+    return result
@@ -2,7 +2,6 @@ import os
 import sys
 import threading
 import queue
-import math
 import copy
 import concurrent.futures
 
@@ -15,8 +14,11 @@ import spamclustering.algorithms.ctph as ctph
 import spamclustering.benchmarking.clusterdiff as cdiff
 import spamclustering.benchmarking.difftool as dtool
 import spamclustering.mailIo.mailIo as mailIo
+import spamclustering.mboxReader.mboxStream as mboxStream
 import spamclustering.preprocess.extentedemailmessage as exm
 import spamclustering.preprocess.featureselector as fs
+import spamclustering.preprocess.payloadscanner as ps
+import spamclustering.preprocess.vocabulary as voc
 
 def read_files(input_path):
     file_list = []
@@ -30,33 +32,60 @@ def read_files(input_path):
         file_list = [input_path]
     return file_list
 
-def algorithm_constructor_wrapper(job_id, job_args, features, out_path):
+def algorithm_constructor_wrapper(job_id, job_args, features,
+                                  encoded_features, out_path):
     algo_name = job_args[0]
     algo = None
     match(algo_name):
         case "CCTree":
-            algo = cctree.CcTreeClustering(features, out_path, job_args[1])
+            algo = cctree.CcTreeClustering(encoded_features, out_path,
+                                           job_args[1])
         case "FPTree":
-            algo = fptree.FPTreeClustering(features, out_path, job_args[1])
+            algo = fptree.FPTreeClustering(encoded_features, out_path,
+                                           job_args[1])
         case "Clope":
-            algo = clope.ClopeClustering(features, out_path, job_args[1])
+            algo = clope.ClopeClustering(encoded_features, out_path,
+                                         job_args[1])
         case "CTPH":
             algo = ctph.Ctph(features, out_path, job_args[1])
     algo.id = job_id
     return algo
 
-def create_extended_mail_list(file_list):
+def create_extended_mail_list(file_list, payload_scanner='regex'):
+    reader = mailIo.EmlReader()
+    mails = ((f_path, f_path) for f_path in file_list)
+    return extend_mail_list(mails, reader.read, payload_scanner)
+
+def extend_mail_list(mails, read_mail, payload_scanner='regex'):
+    """ Read mails, create ExtentedEmailMessage objects and extract their
+    payloads.
+
+    Each mail is read inside the error handling, so a mail which cannot be
+    read is skipped like a mail whose payload cannot be extracted.
+
+    :param mails: Path of each mail and the source to read it from.
+    :type mails: iterable of tuple
+    :param read_mail: Returns the parsed message and the raw bytes of a
+        source.
+    :type read_mail: callable
+    :return: Extended messages, error log and ill formed files.
+    :rtype: tuple of list, list and set
+    """
     result = []
+    scanner = ps.PAYLOAD_SCANNERS[payload_scanner]()
     error_log = []
     count = 0
-    list_len = len(file_list)
     illformed_files = set()
-    for f_path in file_list:
+    for f_path, source in mails:
         #print('[{0}|{1}] Processing {2}'.format(count, list_len, file))
         _, message_id = os.path.split(f_path) 
+        extMessage = None
         try:
-            message = mailIo.readMailFromEmlFile(f_path)            
-            extMessage = exm.ExtentedEmailMessage(message, f_path)
+            message, raw_bytes = read_mail(source)
+            if message is None:
+                raise OSError('File does not exist')
+            extMessage = exm.ExtentedEmailMessage(message, f_path, raw_bytes,
+                                                  payload_scanner=scanner)
             extMessage.extract_payload()
             result.append(extMessage)
         except UnicodeEncodeError as u_error:
@@ -67,11 +96,18 @@ def create_extended_mail_list(file_list):
             print(error_string)
         except ValueError as v_error:
             error_string = \
-                'Mail {} produced a ValueError:{}'.format(fif_pathle,
+                'Mail {} produced a ValueError:{}'.format(f_path,
                                                           str(v_error))
             error_log += error_string + '\n'
-            error_log += "Content of mail:\n"
-            error_log += str(extMessage.header_dict) + '\n'
+            if extMessage is not None:
+                error_log += "Content of mail:\n"
+                error_log += str(extMessage.header_dict) + '\n'
+            illformed_files.add(message_id)
+            print(error_string)
+        except OSError as os_error:
+            error_string = \
+                'Mail {} could not be read:{}'.format(f_path, str(os_error))
+            error_log += error_string + '\n'
             illformed_files.add(message_id)
             print(error_string)
         count += 1
@@ -83,6 +119,88 @@ def collect_features(mail_list):
     return featureSelector.get_categorigal_features()
     #return featureSelector.feature_dict
 
+def extract_features_from_files(file_list, payload_scanner='regex'):
+    """ Read, parse and select the features of a chunk of files.
+
+    Runs in a worker process of :func:`ingest_files`. Only the categorical
+    feature dicts are sent back to the parent, not the parsed messages.
+
+    :return: Features of all mails, error log and ill formed files.
+    :rtype: tuple of dict, list and set
+    """
+    mail_list, error_log, illformed_files = \
+        create_extended_mail_list(file_list, payload_scanner)
+    return collect_features(mail_list), error_log, illformed_files
+
+def extract_features_from_archive(path, payload_scanner='regex'):
+    """ Read, parse and select the features of all eml files of a tar
+    archive, see :meth:`spamclustering.mailIo.mailIo.EmlReader.read_archive`.
+
+    The archive is a single stream, so it is processed by this process.
+
+    :return: Features of all mails, error log and ill formed files.
+    :rtype: tuple of dict, list and set
+    """
+    reader = mailIo.EmlReader()
+    mail_list, error_log, illformed_files = \
+        extend_mail_list(reader.archive_members(path), reader.read_member,
+                         payload_scanner)
+    return collect_features(mail_list), error_log, illformed_files
+
+def ingest_files(file_list, num_of_workers, payload_scanner='regex',
+                 files_per_task=64, max_pending_tasks=None):
+    """ Compute the features of all files in a process pool.
+
+    Workers get chunks of file paths and read, parse and select features on
+    their own. At most max_pending_tasks chunks are submitted at a time, so
+    neither paths nor results pile up in the queues of the pool.
+
+    :param file_list: Paths of the eml files.
+    :type file_list: list of str
+    :param num_of_workers: Number of worker processes.
+    :type num_of_workers: int
+    :param payload_scanner: Name of the payload scanner to use, see
+        :data:`spamclustering.preprocess.payloadscanner.PAYLOAD_SCANNERS`.
+    :type payload_scanner: str
+    :param files_per_task: Number of files per chunk.
+    :type files_per_task: int
+    :param max_pending_tasks: Maximal number of chunks submitted but not
+        collected yet. Defaults to twice the number of workers.
+    :type max_pending_tasks: int
+    :return: Features of all mails in the order of file_list, error log and
+        ill formed files.
+    :rtype: tuple of dict, list and set
+    """
+    if max_pending_tasks is None:
+        max_pending_tasks = 2 * num_of_workers
+    features = dict()
+    error_log = []
+    illformed_files = set()
+
+    def collect(job):
+        job_features, job_error_log, job_illformed_files = job.result()
+        features.update(job_features)
+        error_log.extend(job_error_log)
+        illformed_files.update(job_illformed_files)
+
+    with concurrent.futures.ProcessPoolExecutor(num_of_workers) as executor:
+        pending = set()
+        for start in range(0, len(file_list), files_per_task):
+            if len(pending) >= max_pending_tasks:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for job in done:
+                    collect(job)
+            chunk = file_list[start:start + files_per_task]
+            pending.add(executor.submit(extract_features_from_files, chunk,
+                                        payload_scanner))
+        for job in concurrent.futures.as_completed(pending):
+            collect(job)
+    # chunks finish in any order, restore the order of the files
+    features = {path: features[path] for path in file_list
+                if path in features}
+    return features, error_log, illformed_files
+
 def perform_clustering(algorithm):
     algorithm.do_clustering()
     print("Finished job with ID:", algorithm.id, id(algorithm))
@@ -128,39 +246,32 @@ def main():
                 if create == 'y':
                     os.mkdir(out_path)
 
-        #create objects of class extendedEmailMessage from input files
-        list_of_messages = []
-        error_log = []
-        list_of_messages, error_log, illformed_files = \
-            create_extended_mail_list(file_list)
-
         num_of_threads = 8
-        #create threads to process files
-        files_to_process = len(list_of_messages)
-        files_per_thread = math.trunc(files_to_process / num_of_threads)
-        thread_list = []
-        thread_files = []
-        offset =  0
-        for x in range(0, num_of_threads-1):
-            thread_files += [
-                list_of_messages[0 + offset:offset + files_per_thread]
-            ]
-            offset += files_per_thread
-        thread_files += [list_of_messages[-(files_to_process - offset):]]
+        # 'regex' or 'mime', see payloadscanner.PAYLOAD_SCANNERS
+        payload_scanner = 'regex'
+        # workers read, parse and select features of the files, only the
+        # feature dicts are sent back
+        if mailIo.isTarArchive(argv[1]):
+            features, error_log, illformed_files = \
+                extract_features_from_archive(argv[1], payload_scanner)
+        elif os.path.isfile(argv[1]) and \
+           (os.path.splitext(argv[1])[1] != '.eml'):
+            # MBox files, compressed ones as well, are processed without
+            # extracting eml files
+            features, error_log, illformed_files = \
+                mboxStream.extractMboxFeatures(
+                    argv[1], num_of_threads, payload_scanner=payload_scanner)
+        else:
+            features, error_log, illformed_files = \
+                ingest_files(file_list, num_of_threads, payload_scanner)
 
         results = []
         executor = concurrent.futures.ProcessPoolExecutor(num_of_threads)
-        for files in thread_files:
-            results.append(executor.submit(collect_features, files))
-
-        features = dict()
-        for f in concurrent.futures.as_completed(results):
-             features.update(f.result())
-
-        concurrent.futures.wait(results)
-        results.clear()
 
-        (len(features))
+        # tree and transaction based algorithms only compare items, so they
+        # work on integer item IDs instead of feature strings
+        vocabulary = voc.Vocabulary()
+        encoded_features = vocabulary.encode_feature_dict(features)
 
         job_dict = {
 
@@ -189,7 +300,8 @@ def main():
         for job_id, job_args in job_dict.items():
             algo_list.append(algorithm_constructor_wrapper(job_id,
                                                            job_args,
-                                                           features, 
+                                                           features,
+                                                           encoded_features,
                                                            out_path))
 
         for algo in algo_list:
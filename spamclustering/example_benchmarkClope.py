@@ -0,0 +1,100 @@
+import sys
+import time
+
+import spamclustering.algorithms.clope as clope
+import spamclustering.benchmarking.syntheticcorpus as sc
+
+
+class ProfitCheckingClope(clope.ClopeClustering):
+    """ CLOPE clustering which checks that every move of the second phase
+    increases the profit of the clustering.
+    """
+    def __init__(self, feature_dict, output_path, r=2):
+        clope.ClopeClustering.__init__(self, feature_dict, output_path, r)
+        self.num_of_moves = 0
+        self.failed_moves = []
+
+    def move_vector(self, vector_id, feature_vector, source, target):
+        """ Record the profit before and after the move, see
+        :meth:`spamclustering.algorithms.clope.ClopeClustering.move_vector`.
+        """
+        profit_before = self.profit()
+        clope.ClopeClustering.move_vector(self, vector_id, feature_vector,
+                                          source, target)
+        profit_after = self.profit()
+        self.num_of_moves += 1
+        if profit_after <= profit_before:
+            self.failed_moves.append((vector_id, profit_before,
+                                      profit_after))
+
+
+def partition_of(algorithm):
+    """ Return the clusters of a clustering independent of their UUIDs.
+
+    :param algorithm: Algorithm which did its clustering.
+    :type algorithm: :class:`spamclustering.algorithms.clope.ClopeClustering`
+    :return: Sorted member lists of all clusters.
+    :rtype: list of list of str
+    """
+    return sorted(sorted(cluster.cluster_members)
+                  for cluster in algorithm.cluster_dict.values())
+
+
+def main():
+    """
+    Measures the run time of the CLOPE clustering against the size of a
+    synthetic corpus. For each corpus size the time of a complete clustering
+    run is printed together with the number of resulting clusters, for the
+    exact algorithm and with the item index. The last column tells whether
+    both result in the same clusters.
+
+    Afterwards, the clustering is repeated while the profit is recorded
+    around each move of the second phase. The number of moves and of moves
+    which do not increase the profit are printed, the latter should be 0.
+    As the profit is computed twice per move, this check runs on the
+    smallest corpus size only.
+
+    Run with:
+
+    python -m spamclustering.example_benchmarkClope [<size_1> <size_2> ...]
+
+    from root directory.
+    """
+    argv = sys.argv
+    corpus_sizes = [500, 1000, 2000, 4000]
+    if len(argv) > 1:
+        corpus_sizes = [int(size) for size in argv[1:]]
+    print('mails; exact clusters; exact seconds; index clusters; '
+          'index seconds; same clusters')
+    for num_of_mails in corpus_sizes:
+        feature_dict = sc.generate_feature_dict(num_of_mails,
+                                                max(1, num_of_mails // 20))
+        row = [num_of_mails]
+        partitions = []
+        for use_item_index in [False, True]:
+            algorithm = clope.ClopeClustering(feature_dict, '', 2,
+                                              use_item_index=use_item_index)
+            start = time.perf_counter()
+            algorithm.do_clustering()
+            duration = time.perf_counter() - start
+            row += [len(algorithm.cluster_dict), '{:.3f}'.format(duration)]
+            partitions.append(partition_of(algorithm))
+        row.append(partitions[0] == partitions[1])
+        print('; '.join(str(value) for value in row))
+    num_of_mails = min(corpus_sizes)
+    feature_dict = sc.generate_feature_dict(num_of_mails,
+                                            max(1, num_of_mails // 20))
+    print('mails; r; moves; moves without profit increase')
+    for r in [1.5, 2, 3]:
+        algorithm = ProfitCheckingClope(feature_dict, '', r)
+        algorithm.do_clustering()
+        print('{}; {}; {}; {}'.format(num_of_mails, r,
+                                      algorithm.num_of_moves,
+                                      len(algorithm.failed_moves)))
+        for vector_id, profit_before, profit_after in algorithm.failed_moves:
+            print('Move of {} changed profit from {} to {}'.format(
+                vector_id, profit_before, profit_after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import time
+
+import spamclustering.algorithms.ctph as ctph
+import spamclustering.benchmarking.syntheticcorpus as sc
+
+
+def cluster_members(algorithm):
+    """ Return the clusters of an algorithm as sorted lists of members.
+    """
+    return sorted(sorted(cluster.cluster_members)
+                  for _, cluster in algorithm.cluster_dict.items())
+
+
+def main():
+    """
+    Compares the run time of CTPH clustering with and without hash index on a
+    synthetic text corpus and checks that both create the same clusters.
+    Afterwards, the time needed to hash the corpus with a cold and a warm
+    hash cache is printed. Finally, 90 percent of the corpus is clustered,
+    its hash index is saved and loaded again, and the remaining mails are
+    assigned to the clusters incrementally.
+
+    Run with:
+
+    python -m spamclustering.example_benchmarkCtph [<size_1> <size_2> ...]
+
+    from root directory.
+    """
+    argv = sys.argv
+    corpus_sizes = [250, 500, 1000]
+    if len(argv) > 1:
+        corpus_sizes = [int(size) for size in argv[1:]]
+    print('mails; clusters; brute force seconds; index seconds; identical')
+    for num_of_mails in corpus_sizes:
+        feature_dict = sc.generate_text_feature_dict(
+            num_of_mails, max(1, num_of_mails // 10))
+        durations = []
+        clusterings = []
+        for use_index in [False, True]:
+            algorithm = ctph.Ctph(feature_dict, '', use_index=use_index)
+            start = time.perf_counter()
+            algorithm.do_clustering()
+            durations.append(time.perf_counter() - start)
+            clusterings.append(cluster_members(algorithm))
+        print('{}; {}; {:.3f}; {:.3f}; {}'.format(
+            num_of_mails, len(clusterings[0]), durations[0], durations[1],
+            clusterings[0] == clusterings[1]))
+    print('mails; cold cache seconds; warm cache seconds; hits; misses')
+    for num_of_mails in corpus_sizes:
+        feature_dict = sc.generate_text_feature_dict(
+            num_of_mails, max(1, num_of_mails // 10))
+        feature_vectors = list(feature_dict.values())
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache_path = os.path.join(cache_dir, 'hashes.sqlite')
+            algorithm = ctph.Ctph(feature_dict, '',
+                                  hash_cache_path=cache_path)
+            durations = []
+            for _ in range(2):
+                start = time.perf_counter()
+                algorithm._calculate_hashes(feature_vectors)
+                durations.append(time.perf_counter() - start)
+        print('{}; {:.3f}; {:.3f}; {}; {}'.format(
+            num_of_mails, durations[0], durations[1], algorithm.cache_hits,
+            algorithm.cache_misses))
+    print('mails; new mails; milliseconds per new mail; joined clusters')
+    for num_of_mails in corpus_sizes:
+        feature_dict = sc.generate_text_feature_dict(
+            num_of_mails, max(1, num_of_mails // 10))
+        mail_ids = list(feature_dict.keys())
+        num_of_old_mails = num_of_mails * 9 // 10
+        old_mails = {mail_id: feature_dict[mail_id]
+                     for mail_id in mail_ids[:num_of_old_mails]}
+        new_mails = {mail_id: feature_dict[mail_id]
+                     for mail_id in mail_ids[num_of_old_mails:]}
+        algorithm = ctph.Ctph(old_mails, '')
+        algorithm.do_clustering()
+        with tempfile.TemporaryDirectory() as index_dir:
+            index_path = os.path.join(index_dir, 'index.json')
+            algorithm.save_index(index_path)
+            incremental = ctph.Ctph(dict(), '')
+            incremental.load_index(index_path)
+        start = time.perf_counter()
+        assignment = incremental.assign_batch(new_mails)
+        duration = time.perf_counter() - start
+        num_of_joined = sum(1 for cluster_id in assignment.values()
+                            if cluster_id in algorithm.cluster_dict)
+        print('{}; {}; {:.3f}; {}'.format(
+            num_of_mails, len(new_mails), 1000 * duration / len(new_mails),
+            num_of_joined))
+
+
+if __name__ == "__main__":
+    main()
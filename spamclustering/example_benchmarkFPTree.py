@@ -0,0 +1,39 @@
+import sys
+import time
+
+import spamclustering.algorithms.fptree as fptree
+import spamclustering.benchmarking.syntheticcorpus as sc
+
+
+def main():
+    """
+    Measures the time needed to build the FPTree of a synthetic corpus and
+    the time of a complete FPTree clustering.
+
+    Run with:
+
+    python -m spamclustering.example_benchmarkFPTree [<size_1> <size_2> ...]
+
+    from root directory.
+    """
+    argv = sys.argv
+    corpus_sizes = [10000, 100000]
+    if len(argv) > 1:
+        corpus_sizes = [int(size) for size in argv[1:]]
+    print('mails; build seconds; clustering seconds')
+    for num_of_mails in corpus_sizes:
+        feature_dict = sc.generate_feature_dict(num_of_mails,
+                                                max(1, num_of_mails // 20))
+        algorithm = fptree.FPTreeClustering(feature_dict, '')
+        start = time.perf_counter()
+        algorithm.build_tree()
+        build_duration = time.perf_counter() - start
+        start = time.perf_counter()
+        algorithm.do_clustering()
+        clustering_duration = time.perf_counter() - start
+        print('{}; {:.3f}; {:.3f}'.format(num_of_mails, build_duration,
+                                          clustering_duration))
+
+
+if __name__ == "__main__":
+    main()
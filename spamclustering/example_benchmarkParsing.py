@@ -0,0 +1,144 @@
+import email
+import os
+import statistics
+import sys
+import time
+
+import spamclustering.benchmarking.syntheticcorpus as sc
+import spamclustering.mailIo.mailIo as mailIo
+import spamclustering.preprocess.extentedemailmessage as exm
+import spamclustering.preprocess.htmlskeletonparser as hs
+import spamclustering.preprocess.payload as pl
+import spamclustering.preprocess.payloadscanner as ps
+
+
+def load_corpus(argv):
+    """ Return the raw mails to benchmark, either all eml files of the
+    directory or tar archive given as first argument or a number of synthetic
+    mails.
+    """
+    if (len(argv) > 1) and os.path.isdir(argv[1]):
+        result = dict()
+        reader = mailIo.EmlReader()
+        for file in sorted(os.listdir(argv[1])):
+            if os.path.splitext(file)[1] == '.eml':
+                _, result[file] = reader.read(os.path.join(argv[1], file))
+        print(reader)
+        return result
+    if (len(argv) > 1) and mailIo.isTarArchive(argv[1]):
+        reader = mailIo.EmlReader()
+        result = {name: raw_bytes
+                  for name, _, raw_bytes in reader.read_archive(argv[1])}
+        print(reader)
+        return result
+    num_of_mails = 500
+    if len(argv) > 1:
+        num_of_mails = int(argv[1])
+    return sc.generate_mails(num_of_mails, max(1, num_of_mails // 10))
+
+
+def print_timings(name, durations):
+    """ Print mean, median and maximum of per mail durations in ms.
+    """
+    print('{}; {:.3f}; {:.3f}; {:.3f}'.format(
+        name, 1000 * statistics.mean(durations),
+        1000 * statistics.median(durations), 1000 * max(durations)))
+
+
+def text_payloads(payload_list):
+    """ Return offsets, types and content of all text payloads.
+    """
+    return [(payload.start, payload.end, payload.content_type,
+             payload.encoding_type, payload.charset, payload.content)
+            for payload in payload_list if payload.contains_text()]
+
+
+def main():
+    """
+    Measures the time needed per mail to parse it, to extract its payloads
+    and to write the payloads back with update_content. Payloads are
+    extracted once with the raw bytes of the mail kept from read time and
+    once from a serialization created by the email generator. The rows
+    'scan regex' and 'uri regex' show the cost of the precompiled regular
+    expressions of :class:`spamclustering.preprocess.payloadscanner.
+    PayloadScanner` alone, for payload detection on the serialized mail and
+    URI search on the decoded text payloads. 'scan mime walker' shows the
+    cost of the linear :class:`spamclustering.preprocess.payloadscanner.
+    MimeWalker` on the same mails. 'html skeleton' is the time needed to
+    build the skeletons of all HTML payloads. Finally, the number of mails
+    for which both scanners find the same text payloads is printed.
+
+    Run with:
+
+    python -m spamclustering.example_benchmarkParsing [<path_to_files> |
+    <path_to_archive> | <num_of_mails>]
+
+    from root directory. Without a directory or tar archive, synthetic mails
+    are used.
+    """
+    corpus = load_corpus(sys.argv)
+    mail_parser = email.parser.BytesParser(policy=email.policy.default)
+    scanner = ps.PayloadScanner()
+    walker = ps.MimeWalker()
+    num_of_equal_mails = 0
+    timings = {'parse': [], 'extract (raw bytes)': [],
+               'extract (generator)': [], 'update_content': [],
+               'scan regex': [], 'scan mime walker': [], 'uri regex': [],
+               'html skeleton': []}
+    for mail_id, raw_bytes in corpus.items():
+        start = time.perf_counter()
+        message = mail_parser.parsebytes(raw_bytes)
+        timings['parse'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ext_message = exm.ExtentedEmailMessage(message, mail_id, raw_bytes)
+        ext_message.extract_payload()
+        timings['extract (raw bytes)'].append(time.perf_counter() - start)
+
+        serialized_email = ext_message.get_serialized_email()
+        start = time.perf_counter()
+        regex_payloads = scanner.scan(message, serialized_email)
+        timings['scan regex'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        walker_payloads = walker.scan(message, serialized_email)
+        timings['scan mime walker'].append(time.perf_counter() - start)
+        if text_payloads(regex_payloads) == text_payloads(walker_payloads):
+            num_of_equal_mails += 1
+
+        texts = [payload.to_utf8() for payload in ext_message.payload_list]
+        start = time.perf_counter()
+        for text in texts:
+            if text:
+                list(scanner.find_uris(text))
+        timings['uri regex'].append(time.perf_counter() - start)
+
+        html_texts = [payload.to_utf8()
+                      for payload in ext_message.payload_list
+                      if payload.content_type == pl.ContentType.HTMLTEXT]
+        start = time.perf_counter()
+        for text in html_texts:
+            skeleton_parser = hs.HTMLSkeletonParser()
+            skeleton_parser.feed(text)
+            skeleton_parser.close()
+        timings['html skeleton'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ext_message = exm.ExtentedEmailMessage(message, mail_id)
+        ext_message.extract_payload()
+        timings['extract (generator)'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ext_message.update_content()
+        timings['update_content'].append(time.perf_counter() - start)
+    print('{} mails, {:.1f} MB'.format(
+        len(corpus), sum(len(mail) for mail in corpus.values()) / 2**20))
+    print('step; mean ms; median ms; max ms')
+    for name, durations in timings.items():
+        print_timings(name, durations)
+    print('{} of {} mails with equal text payloads of regex and mime '
+          'walker'.format(num_of_equal_mails, len(corpus)))
+
+
+if __name__ == "__main__":
+    main()
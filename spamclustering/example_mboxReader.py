@@ -1,6 +1,9 @@
 from optparse import OptionParser
 import os
+import time
 
+import spamclustering.mailIo.mailIo as mailIo
+import spamclustering.mboxReader.mboxStream as ms
 import spamclustering.mboxReader.mboxToEml as mb
 
 
@@ -15,6 +18,19 @@ def main():
     <path_to_output_dir> 
     
     from root directory
+
+    With -f, no eml files are written. Instead the features of all mails are
+    selected directly from the MBox file by `num_of_workers` processes and
+    the throughput is printed.
+
+    The offsets of all messages are stored in `file.mbox.idx` and reused as
+    long as the MBox file is unchanged. An interrupted extraction is
+    continued with -r. With -p, eml files are written by the given number
+    of processes. Afterwards the throughput in mails/s and MB/s is printed.
+
+    MBox files compressed with gzip, xz or bzip2 (`file.mbox.gz`,
+    `file.mbox.xz`, `file.mbox.bz2`) are decompressed while reading, the
+    size of the read buffers is set with -b.
     """
     usage = "usage %prog [options] arg"
     parser = OptionParser(usage)
@@ -27,6 +43,19 @@ def main():
                            "If set, the program will process all files" +
                            "in the directory. Not recursive, no " +
                            "subdirectories will be searched.", default="False")
+    parser.add_option("-f", "--features", dest="numOfWorkers", type="int",
+                      help="Select the features of all mails with the given" +
+                           " number of processes instead of writing eml" +
+                           " files.", default=0)
+    parser.add_option("-r", "--resume", dest="resume", action="store_true",
+                      help="Continue an interrupted extraction at its last" +
+                           " checkpoint.", default=False)
+    parser.add_option("-p", "--processes", dest="numOfProcesses",
+                      type="int", help="Number of processes writing eml" +
+                                       " files.", default=1)
+    parser.add_option("-b", "--buffer-size", dest="bufferSize", type="int",
+                      help="Read buffer size in bytes for compressed MBox" +
+                           " files.", default=mailIo.DEFAULT_BUFFER_SIZE)
 
     (opts, args) = parser.parse_args()
     inFile = opts.ifFilename
@@ -38,6 +67,17 @@ def main():
               "Inlcude -d switch if it's a directoy")
         return 1
 
+    if opts.numOfWorkers > 0:
+        start = time.perf_counter()
+        features, _, skipped = ms.extractMboxFeatures(
+            inFile, opts.numOfWorkers, buffer_size=opts.bufferSize)
+        duration = time.perf_counter() - start
+        print("Selected features of {} mails in {:.2f} s ({:.1f} mails/s),"
+              " {} mails skipped".format(len(features), duration,
+                                         len(features) / max(duration, 1e-9),
+                                         len(skipped)))
+        return 0
+
     if os.path.isdir(ofFile):
         print("Warning: ", ofFile, "does already exist")
 
@@ -46,7 +86,9 @@ def main():
         print("Not implemented yet! Run for each file without -d switch!")
         return 0
     elif isDir == "False":
-        mb.processMbox(inFile, ofFile)
+        mb.processMbox(inFile, ofFile, opts.resume,
+                       numOfWorkers=opts.numOfProcesses,
+                       bufferSize=opts.bufferSize)
 
 
 if __name__ == "__main__":
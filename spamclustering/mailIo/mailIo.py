@@ -1,9 +1,106 @@
+import bz2
 import email
+import gzip
+import io
+import lzma
 import os
+import tarfile
+import time
+import zlib
 
 from email import parser
 from email import policy
 
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+"""Default size in bytes of the read buffers of compressed files."""
+
+COMPRESSED_FILE_TYPES = {
+    '.gz': gzip.GzipFile,
+    '.xz': lzma.LZMAFile,
+    '.bz2': bz2.BZ2File
+}
+"""File extensions of compressed files and the classes to decompress them."""
+
+ARCHIVE_ERRORS = (tarfile.TarError, EOFError, OSError, lzma.LZMAError,
+                  zlib.error)
+"""Errors raised while reading a damaged (compressed) tar archive."""
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.bz2',
+                  '.tbz2')
+"""File extensions of tar archives."""
+
+
+def isCompressed(path):
+    """Return True if the file is compressed with gzip, xz or bzip2,
+    according to its extension.
+
+    :param path: Path of the file.
+    :type path: str
+    :rtype: bool
+    """
+    return os.path.splitext(path)[1].lower() in COMPRESSED_FILE_TYPES
+
+
+def isTarArchive(path):
+    """Return True if the file is a tar archive, according to its extension.
+
+    :param path: Path of the file.
+    :type path: str
+    :rtype: bool
+    """
+    return path.lower().endswith(TAR_EXTENSIONS)
+
+
+def openBinaryFile(path, bufferSize=DEFAULT_BUFFER_SIZE):
+    """Open a file for reading bytes, decompressing it while reading if it is
+    compressed, see :func:`isCompressed`.
+
+    Both the compressed input and the decompressed output are buffered with
+    bufferSize bytes, so files are streamed without temporary files.
+
+    :param path: Path of the file.
+    :type path: str
+    :param bufferSize: Size of the read buffers in bytes.
+    :type bufferSize: int
+    :return: File object to read the (decompressed) content from.
+    :rtype: :class:`io.BufferedReader`
+    """
+    fp = open(path, 'rb', buffering=bufferSize)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in COMPRESSED_FILE_TYPES:
+        return fp
+    if extension == '.gz':
+        decompressor = gzip.GzipFile(fileobj=fp, mode='rb')
+    else:
+        decompressor = COMPRESSED_FILE_TYPES[extension](fp, mode='rb')
+    return CompressedFileReader(decompressor, fp, bufferSize)
+
+
+class CompressedFileReader(io.BufferedReader):
+    """ Buffered reader of a decompressed stream, see :func:`openBinaryFile`.
+
+    The decompressors of the standard library do not close file objects
+    given to them, so the compressed file is closed together with the
+    reader.
+
+    :param decompressor: Stream of decompressed data.
+    :type decompressor: :class:`io.BufferedIOBase`
+    :param compressed_file: File the decompressor reads from.
+    :type compressed_file: file object
+    :param buffer_size: Size of the read buffer in bytes.
+    :type buffer_size: int
+    """
+    def __init__(self, decompressor, compressed_file, buffer_size):
+        io.BufferedReader.__init__(self, decompressor, buffer_size)
+        self.compressed_file = compressed_file
+
+    def close(self):
+        try:
+            io.BufferedReader.close(self)
+        finally:
+            self.compressed_file.close()
+
+
 def writeMessageToEml(message, fn):
     """Use :class:`email.generator.Generator` to write the given message to the
     respective path.
@@ -18,6 +115,31 @@ def writeMessageToEml(message, fn):
             gen.flatten(message)
 
 
+def messageToEmlString(message):
+    """Return the text :func:`writeMessageToEml` would write for a message.
+
+    :params message: Message to serialize.
+    :type message: :class:`email.message.Message`
+    :return: Content of the eml file.
+    :rtype: str
+    """
+    out = io.StringIO()
+    gen = email.generator.Generator(out)
+    gen.flatten(message)
+    return out.getvalue()
+
+
+def writeEmlFiles(files):
+    """Write a batch of serialized messages, see :func:`messageToEmlString`.
+
+    :params files: Paths and contents of the eml files to write.
+    :type files: list of tuple of str
+    """
+    for fn, content in files:
+        with open(fn, 'w') as out:
+            out.write(content)
+
+
 def readMailFromEmlFile(path):
     """Return an EmailMessage object obtained from a file.
 
@@ -37,3 +159,140 @@ def readMailFromEmlFile(path):
     else:
         print("Error: File does not exists!")
     return result
+
+
+class EmlReader:
+    """ Reads eml files as bytes and parses them with
+    :class:`email.parser.BytesParser`.
+
+    In contrast to :func:`readMailFromEmlFile`, files are not decoded with
+    the platform encoding. The raw bytes are returned together with the
+    message, so later stages (e.g. :class:`spamclustering.preprocess.
+    extentedemailmessage.ExtentedEmailMessage`) do not have to serialize
+    the message again. Each file is read with a single read call, a memory
+    map would not save a copy as the parser needs bytes, which are kept as
+    well. The time needed to read and to parse each file is stored in
+    timings.
+
+    Compressed eml files (see :func:`isCompressed`) are decompressed while
+    reading, tar archives of eml files are read with :meth:`read_archive`.
+
+    :param buffer_size: Size of the read buffers of compressed files and
+        archives in bytes.
+    :type buffer_size: int
+    """
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.mail_parser = email.parser.BytesParser(
+            policy=email.policy.default)
+        self.timings = dict()
+        """Dict of paths and the seconds needed to read and to parse them."""
+
+    def read_bytes(self, path):
+        """ Return the content of a file as bytes.
+
+        :param path: Path of the file to read.
+        :type path: str
+        :return: Content of the file.
+        :rtype: bytes
+        """
+        if isCompressed(path):
+            with openBinaryFile(path, self.buffer_size) as fp:
+                return fp.read()
+        with open(path, 'rb') as fp:
+            return fp.read()
+
+    def read(self, path):
+        """ Read and parse an eml file.
+
+        :param path: Path of the eml file to read.
+        :type path: str
+        :return: Message parsed from the file and the raw bytes of the file.
+            (None, None) if the file does not exist.
+        :rtype: tuple of :class:`email.message.EmailMessage` and bytes
+        """
+        if not os.path.isfile(path):
+            print("Error: File does not exists!")
+            return (None, None)
+        start = time.perf_counter()
+        raw_bytes = self.read_bytes(path)
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        message = self.mail_parser.parsebytes(raw_bytes)
+        parse_time = time.perf_counter() - start
+        self.timings[path] = (read_time, parse_time)
+        return (message, raw_bytes)
+
+    def archive_members(self, path):
+        """ Iterate over the eml files of a tar archive, which may be
+        compressed with gzip, xz or bzip2.
+
+        The archive is read as a stream, members are neither extracted to
+        disk nor is the archive read twice. Each member must be read with
+        :meth:`read_member` before the next one is requested. If the
+        archive itself is damaged, an error is printed and iteration stops
+        at the damaged member.
+
+        :param path: Path of the tar archive.
+        :type path: str
+        :return: Generator of the name and the source of each eml file, to be
+            passed to :meth:`read_member`.
+        :rtype: generator of tuple
+        """
+        try:
+            with tarfile.open(path, mode='r|*',
+                              bufsize=self.buffer_size) as archive:
+                for member in archive:
+                    if (not member.isfile()) or \
+                       (os.path.splitext(member.name)[1] != '.eml'):
+                        continue
+                    yield (member.name, (archive, member))
+        except ARCHIVE_ERRORS as error:
+            print("Error: Archive", path, "is damaged:", error)
+
+    def read_member(self, source):
+        """ Read and parse an eml file of a tar archive. Timings are stored
+        by member name.
+
+        :param source: Archive and member, see :meth:`archive_members`.
+        :type source: tuple
+        :return: Message parsed from the member and its raw bytes.
+        :rtype: tuple of :class:`email.message.EmailMessage` and bytes
+        :raises OSError: If the member cannot be read.
+        """
+        archive, member = source
+        start = time.perf_counter()
+        try:
+            raw_bytes = archive.extractfile(member).read()
+        except ARCHIVE_ERRORS as error:
+            raise OSError('Member {} cannot be read: {}'.format(member.name,
+                                                                 error))
+        read_time = time.perf_counter() - start
+        start = time.perf_counter()
+        message = self.mail_parser.parsebytes(raw_bytes)
+        parse_time = time.perf_counter() - start
+        self.timings[member.name] = (read_time, parse_time)
+        return (message, raw_bytes)
+
+    def read_archive(self, path):
+        """ Read and parse all eml files of a tar archive, see
+        :meth:`archive_members` and :meth:`read_member`.
+
+        :param path: Path of the tar archive.
+        :type path: str
+        :return: Generator of member name, message and raw bytes of each eml
+            file in the archive.
+        :rtype: generator of tuple
+        """
+        for name, source in self.archive_members(path):
+            message, raw_bytes = self.read_member(source)
+            yield (name, message, raw_bytes)
+
+    def __str__(self):
+        num_of_files = max(1, len(self.timings))
+        read_time = sum(timing[0] for timing in self.timings.values())
+        parse_time = sum(timing[1] for timing in self.timings.values())
+        return ('Read {} files, {:.3f} ms read and {:.3f} ms parse time ' +
+                'per file').format(len(self.timings),
+                                   1000 * read_time / num_of_files,
+                                   1000 * parse_time / num_of_files)
@@ -0,0 +1,216 @@
+import json
+import mailbox
+import mmap
+import os
+
+from email import parser
+from email import policy
+
+from . import mboxStream
+
+
+def mboxMessageFromBytes(content):
+    """Create a message like :meth:`mailbox.mbox.get_message` does.
+
+    :param content: Bytes of the message including its 'From ' line, see
+        :meth:`MboxIndex.readRange`.
+    :type content: bytes
+    :return: The message with its 'From ' line set.
+    :rtype: :class:`mailbox.mboxMessage`
+    """
+    line_end = content.find(b'\n')
+    if line_end == -1:
+        line_end = len(content)
+    message = mailbox.mboxMessage(content[line_end + 1:])
+    message.set_from(content[5:line_end].decode('ascii'))
+    return message
+
+
+class MboxIndex:
+    """Persistent index of the messages of an MBox file.
+
+    For each message the start and end offset (see
+    :func:`spamclustering.mboxReader.mboxStream.buildMboxIndex`) and its mail
+    ID (see :func:`spamclustering.mboxReader.mboxStream.mailIdOf`) are
+    stored. The index is written to a sidecar file next to the MBox file,
+    together with size and modification time of the MBox file. As long as
+    both match, the index is loaded instead of scanning the file again.
+    Single messages are read by seeking directly to their offsets.
+
+    :param inPath: Path of the MBox file.
+    :type inPath: str
+    :param entries: Start offset, end offset and mail ID of each message.
+    :type entries: list of tuple
+    :param fingerprint: Size and modification time in ns of the MBox file.
+    :type fingerprint: tuple of int
+    :param indexPath: Path of the sidecar file.
+    :type indexPath: str
+    """
+    def __init__(self, inPath, entries, fingerprint, indexPath=None):
+        self.inPath = inPath
+        self.entries = entries
+        self.fingerprint = fingerprint
+        if indexPath is None:
+            indexPath = MboxIndex.sidecarPath(inPath)
+        self.indexPath = indexPath
+        self.positions = {entry[2]: position
+                          for position, entry in enumerate(entries)}
+        self.mail_parser = parser.BytesParser(policy=policy.default)
+
+    @staticmethod
+    def sidecarPath(inPath):
+        """Return the default path of the sidecar file of an MBox file.
+        """
+        return inPath + '.idx'
+
+    @staticmethod
+    def fingerprintOf(inPath):
+        """Return size and modification time in ns of a file.
+        """
+        stat = os.stat(inPath)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def build(inPath, indexPath=None):
+        """Scan an MBox file and create its index.
+
+        Only the headers of each message are parsed to generate its mail ID,
+        with :data:`email.policy.compat32` like :mod:`mailbox` does.
+        Messages whose mail ID cannot be generated are left out of the index
+        with a warning. Messages sharing a mail ID get unique IDs, see
+        :func:`spamclustering.mboxReader.mboxStream.uniqueMailId`.
+
+        :param inPath: Path of the MBox file.
+        :type inPath: str
+        :param indexPath: Path of the sidecar file, None for the default.
+        :type indexPath: str
+        :return: The new index, not saved yet.
+        :rtype: :class:`spamclustering.mboxReader.mboxIndex.MboxIndex`
+        """
+        fingerprint = MboxIndex.fingerprintOf(inPath)
+        entries = []
+        header_parser = parser.BytesParser(policy=policy.compat32)
+        seen = dict()
+        if fingerprint[0] > 0:
+            with open(inPath, 'rb') as fp:
+                with mmap.mmap(fp.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mbox:
+                    for start, end in mboxStream.buildMboxIndex(mbox):
+                        raw_bytes = mboxStream.readMessageBytes(mbox, start,
+                                                                end)
+                        try:
+                            headers = header_parser.parsebytes(
+                                raw_bytes, headersonly=True)
+                            mailId = mboxStream.mailIdOf(headers, start)
+                        except (UnicodeError, ValueError) as error:
+                            print("Warning: Mail at offset", start, "of",
+                                  inPath, "not indexed:", error)
+                            continue
+                        mailId = mboxStream.uniqueMailId(mailId, start, seen,
+                                                         inPath)
+                        entries.append((start, end, mailId))
+        return MboxIndex(inPath, entries, fingerprint, indexPath)
+
+    @staticmethod
+    def load(inPath, indexPath=None):
+        """Read the sidecar file of an MBox file.
+
+        :param inPath: Path of the MBox file.
+        :type inPath: str
+        :param indexPath: Path of the sidecar file, None for the default.
+        :type indexPath: str
+        :return: The stored index, None if there is no sidecar file or if it
+            belongs to another version of the MBox file.
+        :rtype: :class:`spamclustering.mboxReader.mboxIndex.MboxIndex`
+        """
+        if indexPath is None:
+            indexPath = MboxIndex.sidecarPath(inPath)
+        if not os.path.isfile(indexPath):
+            return None
+        with open(indexPath, 'r') as fp:
+            stored = json.load(fp)
+        fingerprint = tuple(stored['fingerprint'])
+        if fingerprint != MboxIndex.fingerprintOf(inPath):
+            return None
+        entries = [tuple(entry) for entry in stored['entries']]
+        return MboxIndex(inPath, entries, fingerprint, indexPath)
+
+    @staticmethod
+    def loadOrBuild(inPath, indexPath=None):
+        """Load the index of an MBox file, or build and save it if no valid
+        sidecar file exists.
+
+        :param inPath: Path of the MBox file.
+        :type inPath: str
+        :param indexPath: Path of the sidecar file, None for the default.
+        :type indexPath: str
+        :return: Index of the MBox file.
+        :rtype: :class:`spamclustering.mboxReader.mboxIndex.MboxIndex`
+        """
+        result = MboxIndex.load(inPath, indexPath)
+        if result is None:
+            result = MboxIndex.build(inPath, indexPath)
+            result.save()
+        return result
+
+    def save(self):
+        """Write the index to its sidecar file.
+
+        The file is written to a temporary file first and then renamed, so
+        an interrupted write never leaves a broken index behind.
+        """
+        tmpPath = self.indexPath + '.tmp'
+        with open(tmpPath, 'w') as fp:
+            json.dump({'fingerprint': list(self.fingerprint),
+                       'entries': self.entries}, fp)
+        os.replace(tmpPath, self.indexPath)
+
+    def readRange(self, position):
+        """Read the bytes of a single message including its 'From ' line.
+
+        :param position: Position of the message in the MBox file.
+        :type position: int
+        :return: Bytes of the message as stored in the MBox file.
+        :rtype: bytes
+        """
+        start, end = self.entries[position][0], self.entries[position][1]
+        with open(self.inPath, 'rb') as fp:
+            fp.seek(start)
+            return fp.read(end - start)
+
+    def fetchBytes(self, position):
+        """Read the raw bytes of a single message.
+
+        :param position: Position of the message in the MBox file.
+        :type position: int
+        :return: Raw bytes of the message without its 'From ' line.
+        :rtype: bytes
+        """
+        content = self.readRange(position)
+        return mboxStream.readMessageBytes(content, 0, len(content))
+
+    def fetchMboxMessage(self, position):
+        """Read a single message like :meth:`mailbox.mbox.get_message`.
+
+        :param position: Position of the message in the MBox file.
+        :type position: int
+        :return: The message with its 'From ' line set.
+        :rtype: :class:`mailbox.mboxMessage`
+        """
+        return mboxMessageFromBytes(self.readRange(position))
+
+    def fetch(self, mailId):
+        """Read and parse a single message by its mail ID.
+
+        :param mailId: Mail ID of the message.
+        :type mailId: str
+        :return: The message, None if the ID is unknown.
+        :rtype: :class:`email.message.EmailMessage`
+        """
+        position = self.positions.get(mailId)
+        if position is None:
+            return None
+        return self.mail_parser.parsebytes(self.fetchBytes(position))
+
+    def __len__(self):
+        return len(self.entries)
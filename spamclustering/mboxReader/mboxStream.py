@@ -0,0 +1,496 @@
+import concurrent.futures
+import mmap
+import os
+
+from email import parser
+from email import policy
+
+from . import mboxToEml
+from ..mailIo import mailIo
+from ..preprocess import extentedemailmessage as exm
+from ..preprocess import featureselector as fs
+from ..preprocess import payloadscanner as ps
+
+
+def buildMboxIndex(mbox):
+    """Find the byte offsets of all messages of an MBox file.
+
+    Messages start with a line beginning with 'From '. Like
+    :class:`mailbox.mbox`, a message ends before the next 'From ' line and
+    the empty line preceding it. The whole file is scanned once for
+    separators, the messages themselves are not parsed.
+
+    :param mbox: Content of the MBox file, e.g. a memory map.
+    :type mbox: bytes or :class:`mmap.mmap`
+    :return: Start and end offset of each message. The start offset points
+        to the 'From ' line.
+    :rtype: list of tuple of int
+    """
+    result = []
+    if mbox[:5] == b'From ':
+        start = 0
+    else:
+        start = mbox.find(b'\nFrom ')
+        if start == -1:
+            return result
+        start += 1
+    while True:
+        separator = mbox.find(b'\nFrom ', start)
+        if separator == -1:
+            end = len(mbox)
+            # a trailing empty line is not part of the last message either
+            if mbox[end - 2:end] == b'\n\n':
+                end -= 1
+            result.append((start, end))
+            return result
+        end = separator + 1
+        # the empty line before the separator belongs to the separator
+        if (separator > start) and (mbox[separator - 1:separator] == b'\n'):
+            end = separator
+        result.append((start, end))
+        start = separator + 1
+
+
+def readMessageBytes(mbox, start, end):
+    """Return the raw bytes of a message without its 'From ' line.
+
+    :param mbox: Content of the MBox file, e.g. a memory map.
+    :type mbox: bytes or :class:`mmap.mmap`
+    :param start: Start offset of the message, see :func:`buildMboxIndex`.
+    :type start: int
+    :param end: End offset of the message.
+    :type end: int
+    :return: Raw bytes of the message.
+    :rtype: bytes
+    """
+    line_end = mbox.find(b'\n', start, end)
+    if line_end == -1:
+        return b''
+    return mbox[line_end + 1:end]
+
+
+def iterMboxBytes(fp):
+    """Split a stream of MBox content into messages.
+
+    Messages are separated like by :func:`buildMboxIndex`, but the content
+    is read line by line, so streams which do not support random access,
+    e.g. decompressed files, can be processed.
+
+    :param fp: Binary file object to read the MBox content from.
+    :type fp: file object
+    :return: Generator of the start offset in the uncompressed content and
+        the bytes of each message including its 'From ' line.
+    :rtype: generator of tuple of int and bytes
+    """
+    lines = []
+    start = 0
+    position = 0
+    for line in fp:
+        if line.startswith(b'From '):
+            if lines:
+                # the empty line before the separator belongs to the
+                # separator
+                if (len(lines) > 1) and (lines[-1] == b'\n'):
+                    lines.pop()
+                yield (start, b''.join(lines))
+            lines = [line]
+            start = position
+        elif lines:
+            lines.append(line)
+        position += len(line)
+    if lines:
+        if (len(lines) > 1) and (lines[-1] == b'\n'):
+            lines.pop()
+        yield (start, b''.join(lines))
+
+
+def iterBatches(items, batch_size):
+    """Group the items of an iterable into lists of batch_size items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def mailIdOf(message, start):
+    """Return the ID of a message read from an MBox file.
+
+    Uses :func:`spamclustering.mboxReader.mboxToEml.generateMailId` if the
+    message has a Message-ID, otherwise the offset of the message in the
+    file, so IDs of messages without Message-ID do not collide.
+
+    :param message: Message to generate the ID from.
+    :type message: :class:`email.message.Message`
+    :param start: Start offset of the message in the MBox file.
+    :type start: int
+    :return: ID of the message.
+    :rtype: str
+    """
+    if mboxToEml.rawHeader(message, 'Message-ID') is None:
+        return 'offset_{}'.format(start)
+    return mboxToEml.generateMailId(message)
+
+
+def skipMessage(errors, mail_id, error_string):
+    """Print why a message is skipped and record it in errors.
+
+    :param errors: List to append the mail ID and the error string to, None
+        to only print the error.
+    :type errors: list of tuple of str
+    :param mail_id: ID of the skipped message.
+    :type mail_id: str
+    :param error_string: Reason for skipping the message.
+    :type error_string: str
+    """
+    print(error_string)
+    if errors is not None:
+        errors.append((mail_id, error_string))
+
+
+def uniqueMailId(mail_id, start, seen, inPath=''):
+    """Make the ID of a message unique among the messages read so far.
+
+    Resent messages or copies of mailing lists share Message-ID and To, so
+    they get the same mail ID. The ID of each later message is extended by
+    its start offset, which is logged.
+
+    :param mail_id: ID of the message, see :func:`mailIdOf`.
+    :type mail_id: str
+    :param start: Start offset of the message in the MBox file.
+    :type start: int
+    :param seen: Dict of the IDs used so far and the start offsets of their
+        messages, the returned ID is added.
+    :type seen: dict of str and int
+    :param inPath: Path of the MBox file, used in the log message.
+    :type inPath: str
+    :return: Unique ID of the message.
+    :rtype: str
+    """
+    if mail_id in seen:
+        unique_id = '{}_offset_{}'.format(mail_id, start)
+        print('Mail ID {} of {} at offset {} already used at offset {}, '
+              'renamed to {}'.format(mail_id, inPath, start, seen[mail_id],
+                                     unique_id))
+        mail_id = unique_id
+    seen[mail_id] = start
+    return mail_id
+
+
+def parseMboxMessages(messages, inPath='', errors=None, seen=None):
+    """Parse messages split by :func:`iterMboxBytes`.
+
+    Messages which cannot be parsed or whose mail ID cannot be generated are
+    skipped with an error message.
+
+    :param messages: Start offset and bytes including the 'From ' line of
+        each message.
+    :type messages: iterable of tuple of int and bytes
+    :param inPath: Path of the MBox file, used in error messages.
+    :type inPath: str
+    :param errors: List to record skipped messages in, see
+        :func:`skipMessage`.
+    :type errors: list of tuple of str
+    :param seen: IDs used so far, see :func:`uniqueMailId`. Only the
+        messages of this call are considered if None.
+    :type seen: dict of str and int
+    :return: Generator of mail ID, message and raw bytes of each message.
+    :rtype: generator of tuple
+    """
+    if seen is None:
+        seen = dict()
+    mail_parser = parser.BytesParser(policy=policy.default)
+    for start, content in messages:
+        raw_bytes = readMessageBytes(content, 0, len(content))
+        try:
+            message = mail_parser.parsebytes(raw_bytes)
+            mail_id = mailIdOf(message, start)
+        except (UnicodeError, ValueError, AttributeError) as error:
+            skipMessage(errors, 'offset_{}'.format(start),
+                        'Mail at offset {} of {} skipped: {}'.format(
+                            start, inPath, error))
+            continue
+        yield (uniqueMailId(mail_id, start, seen, inPath), message, raw_bytes)
+
+
+def iterMboxMessages(inPath, index=None,
+                     buffer_size=mailIo.DEFAULT_BUFFER_SIZE, errors=None,
+                     seen=None):
+    """Yield the messages of an MBox file one after another.
+
+    The file is mapped into memory, so only the message currently processed
+    is copied and parsed. Messages which cannot be parsed or whose mail ID
+    cannot be generated are skipped with an error message. Compressed files
+    (see :func:`spamclustering.mailIo.mailIo.isCompressed`) are decompressed
+    and split while reading instead, they cannot be indexed. Mail IDs are
+    made unique, see :func:`uniqueMailId`.
+
+    :param inPath: Path of the MBox file.
+    :type inPath: str
+    :param index: Offsets of the messages to read, see
+        :func:`buildMboxIndex`, or entries of a :class:`spamclustering.
+        mboxReader.mboxIndex.MboxIndex`. The whole file is indexed if None.
+    :type index: list of tuple
+    :param buffer_size: Size of the read buffers of compressed files in
+        bytes.
+    :type buffer_size: int
+    :param errors: List to record skipped messages in, see
+        :func:`skipMessage`.
+    :type errors: list of tuple of str
+    :param seen: IDs used so far, see :func:`uniqueMailId`. Only the
+        messages of this call are considered if None.
+    :type seen: dict of str and int
+    :return: Generator of mail ID, message and raw bytes of each message.
+    :rtype: generator of tuple
+    """
+    if seen is None:
+        seen = dict()
+    if mailIo.isCompressed(inPath):
+        if index is not None:
+            raise ValueError('Compressed MBox files cannot be indexed')
+        with mailIo.openBinaryFile(inPath, buffer_size) as fp:
+            yield from parseMboxMessages(iterMboxBytes(fp), inPath, errors,
+                                         seen)
+        return
+    mail_parser = parser.BytesParser(policy=policy.default)
+    with open(inPath, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mbox:
+            if index is None:
+                index = buildMboxIndex(mbox)
+            for entry in index:
+                start, end = entry[0], entry[1]
+                raw_bytes = readMessageBytes(mbox, start, end)
+                try:
+                    message = mail_parser.parsebytes(raw_bytes)
+                    if len(entry) > 2:
+                        mail_id = entry[2]
+                    else:
+                        mail_id = mailIdOf(message, start)
+                except (UnicodeError, ValueError, AttributeError) as error:
+                    skipMessage(errors, 'offset_{}'.format(start),
+                                'Mail at offset {} of {} skipped: {}'.format(
+                                    start, inPath, error))
+                    continue
+                yield (uniqueMailId(mail_id, start, seen, inPath), message,
+                       raw_bytes)
+
+
+def extendMessages(messages, inPath, payload_scanner='regex', errors=None):
+    """Turn parsed messages into ExtentedEmailMessage objects with extracted
+    payloads.
+
+    Messages which cannot be processed are skipped with an error message.
+
+    :param messages: Mail ID, message and raw bytes of each message, see
+        :func:`iterMboxMessages`.
+    :type messages: iterable of tuple
+    :param inPath: Path of the MBox file, used in error messages.
+    :type inPath: str
+    :param payload_scanner: Name of the payload scanner to use, see
+        :data:`spamclustering.preprocess.payloadscanner.PAYLOAD_SCANNERS`.
+    :type payload_scanner: str
+    :param errors: List to record skipped messages in, see
+        :func:`skipMessage`.
+    :type errors: list of tuple of str
+    :return: Generator of messages.
+    :rtype: generator of :class:`spamclustering.preprocess.
+        extentedemailmessage.ExtentedEmailMessage`
+    """
+    scanner = ps.PAYLOAD_SCANNERS[payload_scanner]()
+    for mail_id, message, raw_bytes in messages:
+        try:
+            ext_message = exm.ExtentedEmailMessage(message, mail_id,
+                                                   raw_bytes, scanner)
+            ext_message.extract_payload()
+        except (UnicodeError, ValueError, AttributeError) as error:
+            skipMessage(errors, mail_id,
+                        'Mail {} of {} skipped: {}'.format(mail_id, inPath,
+                                                           error))
+            continue
+        yield ext_message
+
+
+def iterExtendedMessages(inPath, index=None, payload_scanner='regex',
+                         buffer_size=mailIo.DEFAULT_BUFFER_SIZE, errors=None,
+                         seen=None):
+    """Yield the messages of an MBox file as ExtentedEmailMessage objects
+    with extracted payloads, see :func:`extendMessages`.
+
+    :param inPath: Path of the MBox file.
+    :type inPath: str
+    :param index: Offsets of the messages to read, see
+        :func:`buildMboxIndex`. The whole file is indexed if None.
+    :type index: list of tuple of int
+    :param payload_scanner: Name of the payload scanner to use, see
+        :data:`spamclustering.preprocess.payloadscanner.PAYLOAD_SCANNERS`.
+    :type payload_scanner: str
+    :param buffer_size: Size of the read buffers of compressed files in
+        bytes.
+    :type buffer_size: int
+    :param errors: List to record skipped messages in, see
+        :func:`skipMessage`.
+    :type errors: list of tuple of str
+    :param seen: IDs used so far, see :func:`uniqueMailId`.
+    :type seen: dict of str and int
+    :return: Generator of messages.
+    :rtype: generator of :class:`spamclustering.preprocess.
+        extentedemailmessage.ExtentedEmailMessage`
+    """
+    return extendMessages(iterMboxMessages(inPath, index, buffer_size,
+                                           errors, seen),
+                          inPath, payload_scanner, errors)
+
+
+def _extractFeaturesOfRange(inPath, payload_scanner, index):
+    """Select the categorical features of some messages of an MBox file.
+
+    Runs in a worker process of :func:`extractMboxFeatures`.
+
+    :return: Features of the messages, the skipped messages and the start
+        offset of each mail ID, see :func:`uniqueMailId`.
+    :rtype: tuple of dict, list and dict
+    """
+    errors = []
+    seen = dict()
+    messages = iterExtendedMessages(inPath, index, payload_scanner,
+                                    errors=errors, seen=seen)
+    return (fs.FeatureSelector(messages).get_categorigal_features(), errors,
+            seen)
+
+
+def _extractFeaturesOfMessages(inPath, payload_scanner, messages):
+    """Select the categorical features of messages split by
+    :func:`iterMboxBytes`.
+
+    Runs in a worker process of :func:`extractMboxFeatures` for compressed
+    MBox files.
+
+    :return: Features of the messages, the skipped messages and the start
+        offset of each mail ID, see :func:`uniqueMailId`.
+    :rtype: tuple of dict, list and dict
+    """
+    errors = []
+    seen = dict()
+    messages = extendMessages(parseMboxMessages(messages, inPath, errors,
+                                                seen),
+                              inPath, payload_scanner, errors)
+    return (fs.FeatureSelector(messages).get_categorigal_features(), errors,
+            seen)
+
+
+def mapRanges(function, ranges, num_of_workers, *args):
+    """Call function(*args, range) for each range of messages.
+
+    With more than one worker, the ranges are processed by a process pool
+    with at most two ranges per worker pending at a time, so ranges can be
+    produced lazily, e.g. while decompressing a file.
+
+    :param function: Function to call, must be picklable.
+    :type function: callable
+    :param ranges: Ranges of messages.
+    :type ranges: iterable
+    :param num_of_workers: Number of worker processes.
+    :type num_of_workers: int
+    :return: Generator of the number of each range and its result, in the
+        order the ranges are finished.
+    :rtype: generator of tuple
+    """
+    if num_of_workers <= 1:
+        for range_num, messages in enumerate(ranges):
+            yield (range_num, function(*args, messages))
+        return
+    with concurrent.futures.ProcessPoolExecutor(num_of_workers) as executor:
+        pending = dict()
+        for range_num, messages in enumerate(ranges):
+            if len(pending) >= 2 * num_of_workers:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for job in done:
+                    yield (pending.pop(job), job.result())
+            job = executor.submit(function, *args, messages)
+            pending[job] = range_num
+        for job in concurrent.futures.as_completed(pending):
+            yield (pending[job], job.result())
+
+
+def extractMboxFeatures(inPath, num_of_workers=1, messages_per_task=256,
+                        payload_scanner='regex', index=None,
+                        buffer_size=mailIo.DEFAULT_BUFFER_SIZE):
+    """Select the categorical features of all messages of an MBox file
+    without writing them to eml files.
+
+    The offset index is split into ranges of messages_per_task messages.
+    With more than one worker, the ranges are processed by a process pool,
+    see :func:`mapRanges`. Each worker maps the file on its own, so only
+    offsets and the resulting feature dicts are sent between processes.
+
+    Compressed files are decompressed by this process while the workers
+    process the messages read so far. Their ranges contain the message
+    bytes instead of offsets.
+
+    Messages sharing a mail ID are kept apart, the ID of each later message
+    is extended by its start offset, see :func:`uniqueMailId`.
+
+    :param inPath: Path of the MBox file.
+    :type inPath: str
+    :param num_of_workers: Number of worker processes.
+    :type num_of_workers: int
+    :param messages_per_task: Number of messages per range.
+    :type messages_per_task: int
+    :param payload_scanner: Name of the payload scanner to use.
+    :type payload_scanner: str
+    :param index: Offsets of the messages, see :func:`buildMboxIndex`. The
+        whole file is indexed if None.
+    :type index: list of tuple of int
+    :param buffer_size: Size of the read buffers of compressed files in
+        bytes.
+    :type buffer_size: int
+    :return: Dict of mail IDs and their categorical features, in the order
+        of the messages in the file, the error messages of skipped messages
+        and the IDs of skipped messages, like
+        :func:`spamclustering.compare_algorithms.ingest_files`.
+    :rtype: tuple of dict, list and set
+    """
+    range_features = dict()
+    if mailIo.isCompressed(inPath):
+        if index is not None:
+            raise ValueError('Compressed MBox files cannot be indexed')
+        with mailIo.openBinaryFile(inPath, buffer_size) as fp:
+            ranges = iterBatches(iterMboxBytes(fp), messages_per_task)
+            for range_num, features in mapRanges(
+                    _extractFeaturesOfMessages, ranges, num_of_workers,
+                    inPath, payload_scanner):
+                range_features[range_num] = features
+    else:
+        if index is None:
+            with open(inPath, 'rb') as fp:
+                if os.fstat(fp.fileno()).st_size == 0:
+                    return (dict(), [], set())
+                with mmap.mmap(fp.fileno(), 0,
+                               access=mmap.ACCESS_READ) as mbox:
+                    index = buildMboxIndex(mbox)
+        ranges = iterBatches(index, messages_per_task)
+        for range_num, features in mapRanges(
+                _extractFeaturesOfRange, ranges, num_of_workers, inPath,
+                payload_scanner):
+            range_features[range_num] = features
+    result = dict()
+    error_log = []
+    illformed_files = set()
+    seen = dict()
+    for range_num in range(len(range_features)):
+        features, errors, starts = range_features[range_num]
+        # IDs are unique within a range, but not across ranges
+        for mail_id, feature_vector in features.items():
+            result[uniqueMailId(mail_id, starts[mail_id], seen,
+                                inPath)] = feature_vector
+        for mail_id, error_string in errors:
+            error_log.append(error_string)
+            illformed_files.add(mail_id)
+    return (result, error_log, illformed_files)
@@ -1,26 +1,58 @@
+import email.utils
 import hashlib
-import mailbox
+import mmap
 import os
 import re
+import time
 
 from datetime import datetime
+from . import mboxIndex
+from . import mboxStream
 from ..mailIo import mailIo
 
+DATE_COMMENT = re.compile(r' \(.+\)')
+
+
+def rawHeader(message, name):
+    """Return the value of a header as found in the source of the message.
+
+    In contrast to message[name], the value does not depend on the policy
+    of the message, e.g. RFC 2047 encoded words are not decoded.
+
+    :param message: Message to read the header from.
+    :type message: :class:`email.message.Message`
+    :param name: Name of the header.
+    :type name: str
+    :return: Value of the first header of this name, None if missing.
+    :rtype: str
+    """
+    name = name.lower()
+    for key, value in message.raw_items():
+        if key.lower() == name:
+            return value
+    return None
+
 
 def generateMailId(message):
     """Generates an ID for use in the files name.
 
+    The ID is generated from the raw values of the Message-ID and To
+    headers, see :func:`rawHeader`, so the same message gets the same ID
+    regardless of the policy it was parsed with. Non-ASCII bytes of the
+    headers are kept as they are.
+
     :param message: Message to generate the ID from.
     :type message: :class:`email.message.Message`
     :return: ID generated from the mail.
     :rtype: str
     """
-    mailId = str(message['Message-ID']).encode('ascii')
+    mailId = str(rawHeader(message, 'Message-ID')).encode('utf-8',
+                                                         'surrogateescape')
     hashOfId = ''
     if not mailId:
         return None
 
-    mailTo = str(message['To']).encode('ascii')
+    mailTo = str(rawHeader(message, 'To')).encode('utf-8', 'surrogateescape')
     if not mailTo:
         return None
 
@@ -29,38 +61,198 @@ def generateMailId(message):
     return hashOfId
 
 
+def parseMailDate(mailDate):
+    """Parse the Date header of a message.
+
+    The format '%a, %d %b %Y %H:%M:%S %z' is tried first, comments like
+    ' (UTC)' are removed beforehand. Other formats allowed by RFC 2822, e.g.
+    without weekday, are parsed by :func:`email.utils.parsedate_to_datetime`.
+
+    :param mailDate: Value of the Date header.
+    :type mailDate: str
+    :return: The date, None if it cannot be parsed.
+    :rtype: :class:`datetime.datetime`
+    """
+    inputFormat = '%a, %d %b %Y %H:%M:%S %z'
+    try:
+        return datetime.strptime(re.sub(DATE_COMMENT, '', mailDate),
+                                 inputFormat)
+    except ValueError:
+        pass
+    try:
+        return email.utils.parsedate_to_datetime(mailDate)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
 def generateEmlFileName(message):
     """Generate a file name from a given message
 
     :param message: Message to process
     :type message: :class:`email.message.Message`
-    :return: File name generated form the email.
+    :return: File name generated form the email. None if the message has no
+        Date header or its date cannot be parsed.
     :rtype: str
     """
     id = generateMailId(message)
-    inputFormat = '%a, %d %b %Y %H:%M:%S %z'
     if (not message['Date']) or (not id):
         return None
-    mailDate = message['Date']
-    regexp = re.compile(' \(.+\)')
-    mailDate = re.sub(regexp, '', mailDate)
-    mailDate = datetime.strptime(mailDate, inputFormat)
+    mailDate = parseMailDate(str(message['Date']))
+    if mailDate is None:
+        return None
     date = mailDate.strftime('%Y-%m-%d-%H:%M:%S')
 
     return date+'_'+id+'.eml'
 
 
-def processMbox(inPath, outPath):
+def extractMessages(outDir, messages):
+    """Write messages of an MBox file to eml files.
+
+    The messages are serialized first and written as one batch at the end.
+    Messages without a usable file name or that cannot be read or serialized
+    are skipped, the latter are reported by their start offset. Runs in a
+    worker process of :func:`processMbox`.
+
+    :param outDir: Directory to write the eml files to.
+    :type outDir: str
+    :param messages: Start offset and bytes including the 'From ' line of
+        each message, see :func:`spamclustering.mboxReader.mboxStream.
+        iterMboxBytes`.
+    :type messages: iterable of tuple of int and bytes
+    :return: Number of written messages, mail ID and reason of each skipped
+        message and number of bytes read from the MBox file.
+    :rtype: tuple
+    """
+    files = []
+    skipped = []
+    numOfBytes = 0
+    for start, content in messages:
+        numOfBytes += len(content)
+        try:
+            message = mboxIndex.mboxMessageFromBytes(content)
+            fn = generateEmlFileName(message)
+            if fn is None:
+                skipped.append((mboxStream.mailIdOf(message, start),
+                                'no usable Date header'))
+                continue
+            files.append((outDir + '/' + fn,
+                          mailIo.messageToEmlString(message)))
+        except (UnicodeError, ValueError, LookupError) as error:
+            skipped.append(('offset_{}'.format(start), str(error)))
+    mailIo.writeEmlFiles(files)
+    return (len(files), skipped, numOfBytes)
+
+
+def extractRange(inPath, outDir, entries):
+    """Write the messages of a range of an uncompressed MBox file to eml
+    files, see :func:`extractMessages`. The file is mapped into memory.
+
+    :param inPath: Path of the MBox file.
+    :type inPath: str
+    :param outDir: Directory to write the eml files to.
+    :type outDir: str
+    :param entries: Index entries of the messages, see :class:`spamclustering.
+        mboxReader.mboxIndex.MboxIndex`.
+    :type entries: list of tuple
+    :return: See :func:`extractMessages`.
+    :rtype: tuple
+    """
+    with open(inPath, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mbox:
+            return extractMessages(outDir, ((entry[0],
+                                             mbox[entry[0]:entry[1]])
+                                            for entry in entries))
+
+
+def addRangeStats(stats, result):
+    """Add the result of :func:`extractMessages` to the statistics of
+    :func:`processMbox` and print the skipped messages.
+    """
+    written, skipped, numOfBytes = result
+    stats['written'] += written
+    stats['skipped'] += len(skipped)
+    stats['bytes'] += numOfBytes
+    for mailId, reason in skipped:
+        print("Warning: Mail", mailId, "skipped,", reason)
+
+
+def readProgress(progressPath):
+    """Return the number of messages already extracted by an interrupted run
+    of :func:`processMbox`, 0 if there is no progress file.
+
+    :param progressPath: Path of the progress file.
+    :type progressPath: str
+    :return: Number of messages extracted.
+    :rtype: int
+    """
+    if not os.path.isfile(progressPath):
+        return 0
+    with open(progressPath, 'r') as fp:
+        return int(fp.read().strip() or 0)
+
+
+def writeProgress(progressPath, numOfMessages):
+    """Store the number of extracted messages, replacing the progress file
+    atomically.
+
+    :param progressPath: Path of the progress file.
+    :type progressPath: str
+    :param numOfMessages: Number of messages extracted.
+    :type numOfMessages: int
+    """
+    with open(progressPath + '.tmp', 'w') as fp:
+        fp.write(str(numOfMessages))
+    os.replace(progressPath + '.tmp', progressPath)
+
+
+def processMbox(inPath, outPath, resume=False, indexPath=None,
+                numOfWorkers=1, messagesPerTask=256,
+                bufferSize=mailIo.DEFAULT_BUFFER_SIZE):
     """Read the input of an MBox file and extract it. Write the extracted
     E-Mails to the given path.
 
+    The messages are located by a :class:`spamclustering.mboxReader.
+    mboxIndex.MboxIndex`, which is stored next to the MBox file and reused
+    by later runs. The index is split into ranges of messagesPerTask
+    messages, which are extracted by numOfWorkers processes, see
+    :func:`extractRange`. Messages whose date cannot be parsed or that
+    cannot be read are skipped, see :func:`extractMessages`.
+    If several messages get the same file name, the last one written is
+    kept.
+
+    Whenever all ranges up to a message are finished, the number of these
+    messages is stored in the file '.progress' in the output directory. With
+    resume set, extraction continues there instead of the first message.
+    Finally the throughput is printed.
+
+    MBox files compressed with gzip, xz or bzip2 (see :func:`spamclustering.
+    mailIo.mailIo.isCompressed`) are decompressed and split while reading,
+    the extension is removed from the name of the output directory. They are
+    neither indexed nor can their extraction be resumed.
+
     :param inPath: Path of the MBox file to extract.
     :type inPath: str
     :param outPath: Path to write the extracted E-Mails to.
     :type outPath: str
+    :param resume: Continue an interrupted extraction.
+    :type resume: bool
+    :param indexPath: Path of the index file, None for the default.
+    :type indexPath: str
+    :param numOfWorkers: Number of worker processes.
+    :type numOfWorkers: int
+    :param messagesPerTask: Number of messages per range.
+    :type messagesPerTask: int
+    :param bufferSize: Size of the read buffers of compressed files in
+        bytes.
+    :type bufferSize: int
+    :return: Number of written and skipped messages, number of bytes read
+        and the duration in seconds.
+    :rtype: dict
     """
     (_, tail) = os.path.split(inPath)
     (_, dirName) = os.path.split(tail)
+    if mailIo.isCompressed(dirName):
+        dirName = os.path.splitext(dirName)[0]
     outDir = outPath + '/' + dirName
     if os.path.exists(outDir):
         if not os.path.isdir(outDir):
@@ -73,7 +265,48 @@ def processMbox(inPath, outPath):
         print("Create ", outDir)
         os.makedirs(outDir)
 
-    for message in mailbox.mbox(inPath):
-        fn = generateEmlFileName(message)
-        fn = outDir + '/' + fn
-        mailIo.writeMessageToEml(message, fn)
+    start = time.perf_counter()
+    stats = {'written': 0, 'skipped': 0, 'bytes': 0, 'seconds': 0.0}
+    if mailIo.isCompressed(inPath):
+        if resume:
+            print("Warning: Compressed MBox files cannot be resumed,",
+                  "extracting all messages")
+        with mailIo.openBinaryFile(inPath, bufferSize) as fp:
+            ranges = mboxStream.iterBatches(mboxStream.iterMboxBytes(fp),
+                                            messagesPerTask)
+            for _, result in mboxStream.mapRanges(
+                    extractMessages, ranges, numOfWorkers, outDir):
+                addRangeStats(stats, result)
+    else:
+        index = mboxIndex.MboxIndex.loadOrBuild(inPath, indexPath)
+        progressPath = os.path.join(outDir, '.progress')
+        first = 0
+        if resume:
+            first = readProgress(progressPath)
+            print("Resume at message", first, "of", len(index))
+        ranges = [index.entries[rangeStart:rangeStart + messagesPerTask]
+                  for rangeStart in range(first, len(index),
+                                          messagesPerTask)]
+        finished = [False] * len(ranges)
+        nextRange = 0
+        for rangeNum, result in mboxStream.mapRanges(
+                extractRange, ranges, numOfWorkers, inPath, outDir):
+            addRangeStats(stats, result)
+            finished[rangeNum] = True
+            if nextRange == rangeNum:
+                while (nextRange < len(ranges)) and finished[nextRange]:
+                    nextRange += 1
+                writeProgress(progressPath,
+                              min(first + nextRange * messagesPerTask,
+                                  len(index)))
+        if not ranges:
+            writeProgress(progressPath, len(index))
+    stats['seconds'] = time.perf_counter() - start
+    duration = max(stats['seconds'], 1e-9)
+    print("Extracted {} mails ({} skipped) in {:.2f} s, {:.1f} mails/s, "
+          "{:.2f} MB/s".format(stats['written'], stats['skipped'],
+                               stats['seconds'],
+                               (stats['written'] + stats['skipped']) /
+                               duration,
+                               stats['bytes'] / 2**20 / duration))
+    return stats
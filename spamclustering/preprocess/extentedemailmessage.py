@@ -1,8 +1,6 @@
-import re
-import quopri
 import email
 
-import spamclustering.preprocess.payload as pl
+import spamclustering.preprocess.payloadscanner as ps
 
 
 class ExtentedEmailMessage:
@@ -11,8 +9,20 @@ class ExtentedEmailMessage:
     This class add a more complex payload/content part detection to python
     EmailMessage class.
 
+    All payload offsets refer to one decoded serialization of the mail, see
+    :meth:`get_serialized_email`. It is created once and reused by every
+    pattern search. If the raw bytes of the mail are given, they are used
+    instead of serializing the message with the email generator.
+
     :param message: Email message to build this object around.
     :type message: :class:`email.message.Message`
+    :param raw_bytes: Raw bytes the message was parsed from, if available.
+    :type raw_bytes: bytes
+    :param payload_scanner: Engine used to find the payloads, e.g. a
+        :class:`spamclustering.preprocess.payloadscanner.MimeWalker`. The
+        regex based class default is used if None.
+    :type payload_scanner:
+        :class:`spamclustering.preprocess.payloadscanner.PayloadScanner`
     """
     email_message = None
     payload_list = []
@@ -25,109 +35,55 @@ class ExtentedEmailMessage:
         'Thread-Topic': None
     }
     """Dict of knwon headers to process."""
-    # some pattern strings to create regular expressions from
-    # Because of bad design decisions the html pattern contains a pattern for
-    # quoted printable encoded and plain text. TODO: rework all regular
-    # expression to split the task of searching for payload and header data
-    patternHtml = '(?P<Content>(<html(?:.|\s)*/html>)|' + \
-                  '(<=?\s?h=?\s?t=?\s?m=?\s?l=?\s?>(?:.\s)*' + \
-                  '/=?\s?h=?\s?t=?\s?m=?\s?l=?\s?>))'
-    """Regex pattern for detecting html content"""
-    patternBase64 = '\n(?:(?:(?:[a-zA-Z0-9=/+]{4})+)\n)+'
-
-    patternContentType = 'Content-Type: (?P<ContentType>[a-z]+/\w+)'
-    """Regex pattern for detecting 'text/html' content type."""
-    patternTransferEncoding = 'Content-Transfer-Encoding: ' + \
-                              '(?P<Encoding>base64|quoted-printable)\n'
-    """Regex pattern for detecting transferencoding type"""
-    patternQuoted = \
-        '\n' + \
-        '((([a-zA-Z0-9>?@\[\]^_`{|}~!"#$%&\'()*+,\-./:;<\s\\\])|' + \
-        '(=[0-9A-F][0-9A-F]))+=?\n)*'
-    """Regex pattern for detecting quoeted printable content."""
+    payload_scanner = ps.PayloadScanner()
+    """Engine of precompiled regular expressions used to find payloads."""
 
-    def __init__(self, message, id):
+    def __init__(self, message, id, raw_bytes=None, payload_scanner=None):
         self.id = id
+        if payload_scanner is not None:
+            self.payload_scanner = payload_scanner
         self.email_message = message
+        self.raw_bytes = raw_bytes
+        self._serialized_email = None
         self.payload_list = []
         self._extract_meta_headers()
 
+    def get_serialized_email(self):
+        """ Return the serialized mail as string.
+
+        The string is created on the first call, either from the raw bytes
+        (with line endings normalized to '\\n' like the email generator
+        writes them) or by serializing the message, and cached afterwards.
+
+        :return: Decoded serialization of the mail.
+        :rtype: str
+        """
+        if self._serialized_email is None:
+            if self.raw_bytes is not None:
+                serialized_bytes = self.raw_bytes.replace(b'\r\n', b'\n')
+            else:
+                serialized_bytes = self.email_message.as_bytes()
+            self._serialized_email = serialized_bytes.decode('utf-8',
+                                                             'ignore')
+        return self._serialized_email
+
+    def set_email_message(self, message):
+        """ Replace the underlying message and drop its cached serialization.
+
+        :param message: New message.
+        :type message: :class:`email.message.Message`
+        """
+        self.email_message = message
+        self.raw_bytes = None
+        self._serialized_email = None
+
     def extract_payload(self):
         """ Extract payload/content parts from an email.
         Extract all content parts from the mail and create several payload
         objects form the extracted data.
         """
-        matches = []
-        # check if the message is multipart and perform the respective payload
-        # pattern matching.
-        if self.email_message.get_content_maintype() == 'multipart':
-            pattern_list = [
-                 self.patternContentType + '.*\s'
-                 + '(?:\s*[-.;\w"]+=[-.;\w"]+\s*)*'
-                 + self.patternTransferEncoding
-                 + '(?:Content-ID: (?P<ContentID>.*)\n)?'
-                 + '\s*' + '(?P<Content>' + self.patternBase64 + '|' +
-                 self.patternQuoted + ')'
-            ]
-            # check for all supported forms of payload int the whole mail
-            matches = self._match_pattern_list(pattern_list)
-            for match_obj in matches:
-                transfer_encoding = self._retrieve_encoding(match_obj)
-                content_type = self._retrieve_content_type(match_obj)
-                self.payload_list.append(
-                    self._create_payload_from_match(match_obj, content_type,
-                                                    transfer_encoding))
-        # if the mail is not multipart, we have to use different regex because
-        # headers can be inserted between encoding information and content.
-        else:
-            content_type = pl.ContentType.UNDEFINED
-            content_charset = ''
-            serialized_email = self.email_message.as_bytes().decode('utf-8',
-                                                                    'ignore')
-            # first check if it's some kind of text content
-            match self.email_message.get_content_type():
-                case 'text/plain':
-                    content_type = pl.ContentType.PLAINTEXT
-                case 'text/html':
-                    content_type = pl.ContentType.HTMLTEXT
-                case _:
-                    content_type = pl.ContentType.UNDEFINED
-                    return
-            # get the transfer encoding
-            encoding_re = re.compile(self.patternTransferEncoding)
-            match_obj = encoding_re.search(serialized_email)
-            content_encoding = self._retrieve_encoding(match_obj)
-            # depending on the encoding and content type, the char set
-            # information can be found in different patterns.
-            match content_encoding:
-                case pl.Encoding.BASE64:
-                    content_re = self.patternBase64
-                    content_charset = re.compile(
-                            '\s*charset=\"([a-zA-Z0-9_-]+)\"\n').search(
-                                                        serialized_email)
-                case pl.Encoding.QUOTEDPRINTABLE:
-                    content_re = '\n' + self.patternQuoted
-                    pattern = '\s*charset=\"([a-zA-Z0-9_-]+)\"\n'
-                    if content_type == pl.ContentType.HTMLTEXT:
-                        pattern = 'charset=3D(?P<charset>[a-zA-Z20-9-_]+' +\
-                                  '(=\n[a-zA-z0-9-_]*)?)'
-                    content_charset = re.search(pattern, serialized_email)
-                case _:
-                    content_charset = re.search('charset=(.*)',
-                                                'charset=utf-8')
-                    content_re = self.patternQuoted
-            content_re = re.compile('(?P<Content>' + content_re + '\n)')
-            content_match = content_re.search(serialized_email)
-            content = content_match.group('Content')
-            # define the start and end in the serialized email
-            start = content_match.start()
-            end = content_match.end()
-            # create a payload object and store it in the member list.
-            payload = pl.Payload(start, end, content, content_type,
-                                 content_encoding)
-            payload.set_charset(re.subn(r'=\n', '',
-                                        content_charset.group(1))[0])
-            self.payload_list.append(payload)
+        self.payload_list += self.payload_scanner.scan(
+            self.email_message, self.get_serialized_email())
 
     def update_content(self):
         """ Overwrite parts of the mail with the current payloads.
@@ -135,10 +91,10 @@ class ExtentedEmailMessage:
         parts of the original mail with the payload's content. More detailed,
         content's are replaced in place in the email's serialized string
         representation. After replacement this string is parsed again to create
-        a new EmailMessage from it.
+        a new EmailMessage from it. Since headers are updated afterwards,
+        this is the only place where the message is serialized again.
         """
-        serialized_email = self.email_message.as_bytes().decode('utf-8',
-                                                                'ignore')
+        serialized_email = self.get_serialized_email()
         # sort list by payload.start, so that the can be replaced in place in
         # the string.
         # key must be callable -> call lambda which returns start
@@ -171,7 +127,7 @@ class ExtentedEmailMessage:
         parser = email.parser.Parser(policy=email.policy.default)
         # we might have now a completely different message, so we should do the
         # initializing process again to override data of the old message
-        self.email_message = parser.parsestr(result)
+        self.set_email_message(parser.parsestr(result))
         self._update_meta_headers()
         self._extract_meta_headers()
         self.payload_list = []
@@ -193,110 +149,6 @@ class ExtentedEmailMessage:
         for key in self.header_dict:
             self.header_dict[key] = message.get(key)
 
-    def _match_pattern_list(self, pattern_list):
-        """Find matches in the serialized email.
-
-        :param pattern_list: List of pattern strings to search in the mail.
-        :type pattern_list: list of str
-
-        :return: A list of match_objects. Returns an empty list if no matches
-            were found.
-        :rtype: list of :class:`re.Match`
-        """
-        result = []
-        serialized_email = self.email_message.as_bytes().decode('utf-8',
-                                                                'ignore')
-        for pattern in pattern_list:
-            regexp = re.compile(pattern)
-            for match_obj in regexp.finditer(serialized_email):
-                result.append(match_obj)
-        return result
-
-    def _create_payload_from_match(self, match_obj, content_type,
-                                   transfer_encoding):
-        """ Create a payload form a match_obj and additional information.
-
-        :param match_obj: match  to generate the payload from
-        :type match_obj: :class:`re.Match`
-        :param content_type: ContentType of the payload.
-        :type content_type:
-            :class:`spamclustering.preprocess.encodingConverter.ContentType`
-        :param transfer_encoding: TransferEndoding of the payload.
-        :type transfer_encoding:
-            :class:`spamclustering.preprocess.encodingConverter.Encoding`
-        :returns: The newly created Payload object.
-        :rtype:
-            :class:`spamclustering.preprocess.encodingConverter.Payload`
-        """
-        # Extract start, end and content of from the match_obj
-        start = match_obj.start('Content')
-        end = match_obj.end('Content')
-        content = match_obj.group('Content')
-        # create payload
-        payload = pl.Payload(start, end, content,
-                             content_type[0], transfer_encoding)
-        payload.extension = content_type[1]
-        is_text = payload.content_type in [pl.ContentType.PLAINTEXT,
-                                           pl.ContentType.HTMLTEXT]
-        # if we got some kind of text payload, we might want to extract the
-        # text's character set information for corrent en- and decoding.
-        if is_text is True:
-            if (payload.encoding_type is pl.Encoding.QUOTEDPRINTABLE) and \
-               (payload.content_type is pl.ContentType.HTMLTEXT):
-                pattern = \
-                    'charset=3D(?P<charset>[a-zA-Z0-9-_]+(=\n[a-zA-z0-9-_]*)?)'
-            else:
-                pattern = 'charset=\"(?P<charset>[a-zA-Z0-9-_]+)\"'
-            charset_match = re.search(pattern, match_obj.group(0))
-            if charset_match:
-                char_set = quopri.decodestring(charset_match.group('charset'))
-                payload.set_charset(str(char_set, 'utf-8').strip())
-        return payload
-
-    def _retrieve_encoding(self, match_obj):
-        """Extract transfer encoding information from an re.match_obj.
-
-        :param match_obj: Match to extract the encoding from.
-        :type match_obj: :class:`re.Match`
-        :returns: Transfer encoding type.
-        :rtype:
-            :class:`spamclustering.preprocess.encodingConverter.Encoding`
-        """
-        if match_obj is None:
-            return pl.Encoding.UNDEFINED
-        match match_obj.group('Encoding'):
-            case 'base64':
-                return pl.Encoding.BASE64
-            case 'quoted-printable':
-                return pl.Encoding.QUOTEDPRINTABLE
-            case _:
-                return pl.Encoding.UNDEFINED
-
-    def _retrieve_content_type(self, match_obj):
-        """ Extract content type of a mails content from an re.match_obj
-
-        :param match_obj: Match to extract content type information from.
-        :type match_obj: :class:`re.Match`
-
-        :returns: Type of the paylaod.
-        :rtype:
-            :class:`spamclustering.preprocess.encodingConverter.ContentType`
-        """
-        if match_obj is None:
-            return pl.ContentType.UNDEFINED
-        content_extension = match_obj.group('ContentType').split('/')
-        content_type = content_extension[0]
-        extension = content_extension[1]
-        match (content_type, extension):
-            case ('text', 'plain'):
-                return (pl.ContentType.PLAINTEXT, extension)
-            case ('text', 'html'):
-                return (pl.ContentType.HTMLTEXT, extension)
-            case ('image', _):
-                return (pl.ContentType.IMAGE, extension)
-            case _:
-                return pl.ContentType.UNDEFINED
-
     def __str__(self):
         result = 'This is an ExtendedEmailMessage object. \n'
         for key in self.header_dict.keys():
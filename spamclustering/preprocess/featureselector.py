@@ -1,7 +1,7 @@
 import os.path
-import re
 
 import spamclustering.preprocess.payload as pl
+import spamclustering.preprocess.payloadscanner as ps
 import spamclustering.preprocess.htmlskeletonparser as hs
 
 class FeatureSelector:
@@ -54,6 +54,9 @@ class FeatureSelector:
         made available to other objects.
     :type feature_availability: dict(), string as keys, Boolean as value
     """
+    payload_scanner = ps.PayloadScanner()
+    """Engine of precompiled regular expressions used to find URIs."""
+
     def __init__(self, list_of_messages):
         """ Constructor
         :param list_of_messages: A list of messages from which feature should 
@@ -126,44 +129,12 @@ class FeatureSelector:
         return result
 
     def _search_for_uris(self, message):
-        uri_re = re.compile(r"""(
-                            # first common URI schemes used for web content
-                            # btw make all inner regexs uncapturing
-                            (?P<scheme>https|http|ftp|mailto|file|data|irc):
-                            # now match any characte which is not whitespace
-                            (?:// # begin fo authority
-                                (?P<user>
-                                    # user info
-                                    [a-zA-Z0-9\-_\.~/\[\]]+
-                                    @
-                                )?
-                                # host
-                                (?P<host>
-                                    [a-zA-Z0-9\-_\.~/\[\]]+
-                                    (?:
-                                        #port
-                                        :[0-9]+
-                                    )?
-                                )?
-                            )?
-                            # path 
-                            (?P<path>[a-zA-Z0-9\-_\.~/\[\]]+)
-                            (?P<query>
-                                # query
-                                \?[a-zA-Z0-9\-_\.~/\[\]]+
-                            )?
-                            (?P<fragment>
-                                #fragment
-                                \#[a-zA-Z0-9\-_\.~/\[\]]+
-                            )?
-                            )
-                            """, re.X)
         uri_list = []
         for payload in message.payload_list:
             # will return None, if no plain text/html text
             payload_utf8 = payload.to_utf8() 
             if payload_utf8:
-                for uri in uri_re.finditer(payload_utf8):
+                for uri in self.payload_scanner.find_uris(payload_utf8):
                     if uri not in uri_list:
                         uri_list.append(uri)
         list_of_schemes = []
@@ -201,10 +172,9 @@ class FeatureSelector:
         total_size = 0
         list_of_types = []
         for attachment in message.email_message.iter_attachments():
-            name_match = re.search(r'name="(?P<file_name>.*)"', 
-                                   attachment.get('Content-Type', ''))
-            if name_match:
-                attachment_name = name_match.group('file_name')
+            attachment_name = self.payload_scanner.find_attachment_name(
+                attachment.get('Content-Type', ''))
+            if attachment_name is not None:
                 list_of_names.append(attachment_name)
                 ext = os.path.splitext(attachment_name)[1]
                 if ext not in list_of_types:
@@ -70,8 +70,7 @@ class MailAnonymizer:
 
         # create a reeeealy large string of the mail to search for any item of
         # the block list
-        search_target = self.extended_mail.email_message.as_bytes().decode(
-                                'utf-8', 'ignore')
+        search_target = self.extended_mail.get_serialized_email()
         for payload in self.extended_mail.payload_list:
             if payload.contains_text() is True:
                 search_target += payload.to_utf8()
@@ -177,11 +176,10 @@ class MailAnonymizer:
         After replacing all found data, the resulting raw mail string is used
         to create a new EmailMessage object, by parsing the string.
         """
-        mail_string = self.extended_mail.email_message.as_bytes().decode(
-                                'utf-8', 'ignore')
+        mail_string = self.extended_mail.get_serialized_email()
         mail_string = self._perform_replacement(mail_string)
         parser = email.parser.Parser(policy=email.policy.default)
-        self.extended_mail.email_message = parser.parsestr(mail_string)
+        self.extended_mail.set_email_message(parser.parsestr(mail_string))
 
     def _find_replacements(self, replacement_candidates):
         """Creates random replacements for each dict key.
@@ -42,7 +42,14 @@ class Payload:
     :type: :class:`spamclustering.preprocess.payload.ContentType`
     :param content_type: Transfer encoding of the mail
     :type: :class:`spamclustering.preprocess.payload.Encoding`
+
+    The results of :meth:`decode` and :meth:`to_utf8` are cached, since
+    feature selection asks for the text of a payload several times. Use
+    :meth:`set_text_content` and :meth:`set_charset` to modify the payload,
+    they invalidate the cache.
     """
+    __slots__ = ('start', 'end', 'content', 'content_type', 'encoding_type',
+                 'extension', 'charset', '_decoded_content', '_text')
 
     def __init__(self, start, end, content, content_type, encoding_type):
         self.start = start
@@ -55,6 +62,13 @@ class Payload:
             self.charset = 'utf-8'
         else:
             self.charset = None
+        self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        """ Drop the cached decoded content and text.
+        """
+        self._decoded_content = None
+        self._text = None
 
     def set_charset(self, charset):
         """Set the char set of the content of this payload.
@@ -64,6 +78,7 @@ class Payload:
         :type charset: str
         """
         self.charset = charset
+        self._text = None
 
     def decode(self):
         """ Use the transfer encoding information to decode the content.
@@ -71,6 +86,8 @@ class Payload:
         :return: Returns an array of bytes representing the decoded content.
         :rtype: bytes
         """
+        if self._decoded_content is not None:
+            return self._decoded_content
         result = bytes(self.content, 'utf-8')
         match self.encoding_type:
             case Encoding.BASE64:
@@ -79,6 +96,7 @@ class Payload:
                 result = quopri.decodestring(result)
             case _:
                 pass
+        self._decoded_content = result
         return result
 
     def do_transfer_encoding(self, content_bytes):
@@ -110,16 +128,11 @@ class Payload:
             otherwise
         :rtype: str
         """
-        result = None
-        content_bytes = self.decode()
-        match self.content_type:
-            case ContentType.PLAINTEXT:
-                result = content_bytes.decode(self.charset, 'ignore')
-            case ContentType.HTMLTEXT:
-                result = content_bytes.decode(self.charset, 'ignore')
-            case _:
-                pass
-        return result
+        if not self.contains_text():
+            return None
+        if self._text is None:
+            self._text = self.decode().decode(self.charset, 'ignore')
+        return self._text
 
     def contains_text(self):
         """ Helper function which helps to siplify checking if this payload
@@ -150,7 +163,7 @@ class Payload:
         content = bytes(text.encode(self.charset))
         content = self.do_transfer_encoding(content)
         self.content = str(content, self.charset)
-        self.content = str(content, self.charset)
+        self._invalidate_cache()
 
     def __str__(self):
         """ Return a string describing the payload and it's content.
@@ -0,0 +1,418 @@
+import quopri
+import re
+
+import spamclustering.preprocess.payload as pl
+
+
+class PayloadScanner:
+    """ Regular expression engine finding payloads and URIs in mails.
+
+    All patterns are compiled once, when this module is imported, and are
+    shared by all instances. ExtentedEmailMessage uses :meth:`scan` to find
+    the payloads of a mail, FeatureSelector uses :meth:`find_uris` and
+    :meth:`find_attachment_name`.
+    """
+    # some pattern strings to create regular expressions from
+    # Because of bad design decisions the html pattern contains a pattern for
+    # quoted printable encoded and plain text. TODO: rework all regular
+    # expression to split the task of searching for payload and header data
+    patternHtml = '(?P<Content>(<html(?:.|\s)*/html>)|' + \
+                  '(<=?\s?h=?\s?t=?\s?m=?\s?l=?\s?>(?:.\s)*' + \
+                  '/=?\s?h=?\s?t=?\s?m=?\s?l=?\s?>))'
+    """Regex pattern for detecting html content"""
+    patternBase64 = '\n(?:(?:(?:[a-zA-Z0-9=/+]{4})+)\n)+'
+
+    patternContentType = 'Content-Type: (?P<ContentType>[a-z]+/\w+)'
+    """Regex pattern for detecting 'text/html' content type."""
+    patternTransferEncoding = 'Content-Transfer-Encoding: ' + \
+                              '(?P<Encoding>base64|quoted-printable)\n'
+    """Regex pattern for detecting transferencoding type"""
+    patternQuoted = \
+        '\n' + \
+        '((([a-zA-Z0-9>?@\[\]^_`{|}~!"#$%&\'()*+,\-./:;<\s\\\])|' + \
+        '(=[0-9A-F][0-9A-F]))+=?\n)*'
+    """Regex pattern for detecting quoeted printable content."""
+    patternMultipart = \
+        patternContentType + '.*\s' + \
+        '(?:\s*[-.;\w"]+=[-.;\w"]+\s*)*' + \
+        patternTransferEncoding + \
+        '(?:Content-ID: (?P<ContentID>.*)\n)?' + \
+        '\s*' + '(?P<Content>' + patternBase64 + '|' + patternQuoted + ')'
+    """Regex pattern for detecting a payload of a multipart mail together
+    with its content type and transfer encoding."""
+
+    multipart_re = re.compile(patternMultipart)
+    transfer_encoding_re = re.compile(patternTransferEncoding)
+    base64_content_re = re.compile('(?P<Content>' + patternBase64 + '\n)')
+    quoted_content_re = re.compile('(?P<Content>\n' + patternQuoted + '\n)')
+    plain_content_re = re.compile('(?P<Content>' + patternQuoted + '\n)')
+    # charset patterns of single part mails
+    charset_line_re = re.compile('\s*charset=\"([a-zA-Z0-9_-]+)\"\n')
+    charset_html_line_re = re.compile(
+        'charset=3D(?P<charset>[a-zA-Z20-9-_]+(=\n[a-zA-z0-9-_]*)?)')
+    # charset patterns of payloads of multipart mails
+    charset_re = re.compile('charset=\"(?P<charset>[a-zA-Z0-9-_]+)\"')
+    charset_html_re = re.compile(
+        'charset=3D(?P<charset>[a-zA-Z0-9-_]+(=\n[a-zA-z0-9-_]*)?)')
+    soft_line_break_re = re.compile(r'=\n')
+    uri_re = re.compile(r"""(
+                        # first common URI schemes used for web content
+                        # btw make all inner regexs uncapturing
+                        (?P<scheme>https|http|ftp|mailto|file|data|irc):
+                        # now match any characte which is not whitespace
+                        (?:// # begin fo authority
+                            (?P<user>
+                                # user info
+                                [a-zA-Z0-9\-_\.~/\[\]]+
+                                @
+                            )?
+                            # host
+                            (?P<host>
+                                [a-zA-Z0-9\-_\.~/\[\]]+
+                                (?:
+                                    #port
+                                    :[0-9]+
+                                )?
+                            )?
+                        )?
+                        # path 
+                        (?P<path>[a-zA-Z0-9\-_\.~/\[\]]+)
+                        (?P<query>
+                            # query
+                            \?[a-zA-Z0-9\-_\.~/\[\]]+
+                        )?
+                        (?P<fragment>
+                            #fragment
+                            \#[a-zA-Z0-9\-_\.~/\[\]]+
+                        )?
+                        )
+                        """, re.X)
+    attachment_name_re = re.compile(r'name="(?P<file_name>.*)"')
+
+    def scan(self, message, serialized_email):
+        """ Find all payloads of a mail.
+
+        :param message: Parsed mail.
+        :type message: :class:`email.message.Message`
+        :param serialized_email: Serialization of the mail the offsets of the
+            payloads refer to.
+        :type serialized_email: str
+        :return: Payloads found in the mail.
+        :rtype: list of :class:`spamclustering.preprocess.payload.Payload`
+        """
+        # check if the message is multipart and perform the respective payload
+        # pattern matching.
+        if message.get_content_maintype() == 'multipart':
+            return self._scan_multipart(message, serialized_email)
+        return self._scan_single_part(message, serialized_email)
+
+    def _scan_multipart(self, message, serialized_email):
+        """ Find the payloads of a multipart mail.
+        """
+        result = []
+        # check for all supported forms of payload int the whole mail
+        for match_obj in self.multipart_re.finditer(serialized_email):
+            transfer_encoding = self._retrieve_encoding(match_obj)
+            content_type = self._retrieve_content_type(match_obj)
+            result.append(self._create_payload_from_match(
+                match_obj, content_type, transfer_encoding))
+        return result
+
+    def _scan_single_part(self, message, serialized_email):
+        """ Find the payload of a mail which is not multipart.
+
+        We have to use different regex because headers can be inserted
+        between encoding information and content.
+        """
+        content_type = pl.ContentType.UNDEFINED
+        content_charset = ''
+        # first check if it's some kind of text content
+        match message.get_content_type():
+            case 'text/plain':
+                content_type = pl.ContentType.PLAINTEXT
+            case 'text/html':
+                content_type = pl.ContentType.HTMLTEXT
+            case _:
+                return []
+        # get the transfer encoding
+        match_obj = self.transfer_encoding_re.search(serialized_email)
+        content_encoding = self._retrieve_encoding(match_obj)
+        # depending on the encoding and content type, the char set
+        # information can be found in different patterns.
+        match content_encoding:
+            case pl.Encoding.BASE64:
+                content_re = self.base64_content_re
+                content_charset = self.charset_line_re.search(
+                    serialized_email).group(1)
+            case pl.Encoding.QUOTEDPRINTABLE:
+                content_re = self.quoted_content_re
+                charset_re = self.charset_line_re
+                if content_type == pl.ContentType.HTMLTEXT:
+                    charset_re = self.charset_html_line_re
+                content_charset = charset_re.search(serialized_email).group(1)
+            case _:
+                content_charset = 'utf-8'
+                content_re = self.plain_content_re
+        content_match = content_re.search(serialized_email)
+        content = content_match.group('Content')
+        # define the start and end in the serialized email
+        start = content_match.start()
+        end = content_match.end()
+        # create a payload object
+        payload = pl.Payload(start, end, content, content_type,
+                             content_encoding)
+        payload.set_charset(self.soft_line_break_re.subn('',
+                                                         content_charset)[0])
+        return [payload]
+
+    def find_uris(self, text):
+        """ Find all URIs in a text.
+
+        :param text: Text to search in.
+        :type text: str
+        :return: Iterator over the matches of all URIs, providing the groups
+            'scheme', 'user', 'host', 'path', 'query' and 'fragment'.
+        :rtype: iterator of :class:`re.Match`
+        """
+        return self.uri_re.finditer(text)
+
+    def find_attachment_name(self, content_type):
+        """ Extract the file name from the Content-Type header of an
+        attachment.
+
+        :param content_type: Value of the Content-Type header.
+        :type content_type: str
+        :return: The file name, None if the header contains no name.
+        :rtype: str
+        """
+        name_match = self.attachment_name_re.search(content_type)
+        if name_match:
+            return name_match.group('file_name')
+        return None
+
+    def _create_payload_from_match(self, match_obj, content_type,
+                                   transfer_encoding):
+        """ Create a payload form a match_obj and additional information.
+
+        :param match_obj: match  to generate the payload from
+        :type match_obj: :class:`re.Match`
+        :param content_type: ContentType of the payload.
+        :type content_type:
+            :class:`spamclustering.preprocess.encodingConverter.ContentType`
+        :param transfer_encoding: TransferEndoding of the payload.
+        :type transfer_encoding:
+            :class:`spamclustering.preprocess.encodingConverter.Encoding`
+        :returns: The newly created Payload object.
+        :rtype:
+            :class:`spamclustering.preprocess.encodingConverter.Payload`
+        """
+        # Extract start, end and content of from the match_obj
+        start = match_obj.start('Content')
+        end = match_obj.end('Content')
+        content = match_obj.group('Content')
+        return self._create_payload(start, end, content, content_type,
+                                    transfer_encoding, match_obj.group(0))
+
+    def _create_payload(self, start, end, content, content_type,
+                        transfer_encoding, part_string):
+        """ Create a payload and extract its charset from the part string.
+
+        :param start: Start of the content in the serialized mail.
+        :type start: int
+        :param end: End of the content in the serialized mail.
+        :type end: int
+        :param content: Encoded content.
+        :type content: str
+        :param content_type: ContentType and extension of the payload.
+        :type content_type: tuple
+        :param transfer_encoding: TransferEndoding of the payload.
+        :type transfer_encoding:
+            :class:`spamclustering.preprocess.encodingConverter.Encoding`
+        :param part_string: Headers and content of the part, searched for
+            the charset.
+        :type part_string: str
+        :returns: The newly created Payload object.
+        :rtype:
+            :class:`spamclustering.preprocess.encodingConverter.Payload`
+        """
+        payload = pl.Payload(start, end, content,
+                             content_type[0], transfer_encoding)
+        payload.extension = content_type[1]
+        is_text = payload.content_type in [pl.ContentType.PLAINTEXT,
+                                           pl.ContentType.HTMLTEXT]
+        # if we got some kind of text payload, we might want to extract the
+        # text's character set information for corrent en- and decoding.
+        if is_text is True:
+            if (payload.encoding_type is pl.Encoding.QUOTEDPRINTABLE) and \
+               (payload.content_type is pl.ContentType.HTMLTEXT):
+                charset_re = self.charset_html_re
+            else:
+                charset_re = self.charset_re
+            charset_match = charset_re.search(part_string)
+            if charset_match:
+                char_set = quopri.decodestring(charset_match.group('charset'))
+                payload.set_charset(str(char_set, 'utf-8').strip())
+        return payload
+
+    def _retrieve_encoding(self, match_obj):
+        """Extract transfer encoding information from an re.match_obj.
+
+        :param match_obj: Match to extract the encoding from.
+        :type match_obj: :class:`re.Match`
+        :returns: Transfer encoding type.
+        :rtype:
+            :class:`spamclustering.preprocess.encodingConverter.Encoding`
+        """
+        if match_obj is None:
+            return pl.Encoding.UNDEFINED
+        match match_obj.group('Encoding'):
+            case 'base64':
+                return pl.Encoding.BASE64
+            case 'quoted-printable':
+                return pl.Encoding.QUOTEDPRINTABLE
+            case _:
+                return pl.Encoding.UNDEFINED
+
+    def _retrieve_content_type(self, match_obj):
+        """ Extract content type of a mails content from an re.match_obj
+
+        :param match_obj: Match to extract content type information from.
+        :type match_obj: :class:`re.Match`
+
+        :returns: Type of the paylaod.
+        :rtype:
+            :class:`spamclustering.preprocess.encodingConverter.ContentType`
+        """
+        if match_obj is None:
+            return pl.ContentType.UNDEFINED
+        content_extension = match_obj.group('ContentType').split('/')
+        content_type = content_extension[0]
+        extension = content_extension[1]
+        match (content_type, extension):
+            case ('text', 'plain'):
+                return (pl.ContentType.PLAINTEXT, extension)
+            case ('text', 'html'):
+                return (pl.ContentType.HTMLTEXT, extension)
+            case ('image', _):
+                return (pl.ContentType.IMAGE, extension)
+            case _:
+                return pl.ContentType.UNDEFINED
+
+
+class MimeWalker(PayloadScanner):
+    """ Finds the payloads of multipart mails in one linear pass.
+
+    Instead of matching the backtracking payload patterns against the whole
+    mail, the walker jumps from one MIME boundary line to the next, reads
+    the headers of each part and takes everything up to the next boundary
+    as content. Only base64 and quoted-printable encoded text and image
+    parts become payloads, like with :class:`PayloadScanner`, and offsets
+    refer to the same serialization, so update_content works unchanged.
+    Mails which are not multipart are handled by :class:`PayloadScanner`.
+    """
+    folded_line_re = re.compile(r'\n[ \t]+')
+
+    def _scan_multipart(self, message, serialized_email):
+        """ Find the payloads of a multipart mail.
+        """
+        boundaries = set()
+        for part in message.walk():
+            if part.is_multipart() and part.get_boundary():
+                boundaries.add('--' + part.get_boundary())
+        result = []
+        delimiter = self._next_delimiter(serialized_email, 0, boundaries)
+        while delimiter is not None:
+            line_start, line_end, is_closing = delimiter
+            if is_closing:
+                # skip the epilogue of a multipart part
+                delimiter = self._next_delimiter(serialized_email, line_end,
+                                                 boundaries)
+                continue
+            header_end = serialized_email.find('\n\n', line_end)
+            if header_end == -1:
+                break
+            # like with the regex, the content starts with the blank line
+            content_start = header_end + 1
+            delimiter = self._next_delimiter(serialized_email, content_start,
+                                             boundaries)
+            content_end = len(serialized_email)
+            if delimiter is not None:
+                content_end = delimiter[0]
+            payload = self._create_payload_from_part(
+                serialized_email, line_end + 1, header_end, content_start,
+                content_end)
+            if payload is not None:
+                result.append(payload)
+        return result
+
+    def _next_delimiter(self, serialized_email, position, boundaries):
+        """ Find the next boundary line starting after position.
+
+        :return: Start and end of the line and whether it closes a
+            multipart part, None if no further boundary line exists.
+        :rtype: tuple of int, int and bool
+        """
+        while True:
+            position = serialized_email.find('\n--', position)
+            if position == -1:
+                return None
+            line_start = position + 1
+            line_end = serialized_email.find('\n', line_start)
+            if line_end == -1:
+                line_end = len(serialized_email)
+            line = serialized_email[line_start:line_end].rstrip()
+            if line in boundaries:
+                return (line_start, line_end, False)
+            if line.endswith('--') and (line[:-2] in boundaries):
+                return (line_start, line_end, True)
+            position = line_start
+
+    def _create_payload_from_part(self, serialized_email, header_start,
+                                  header_end, content_start, content_end):
+        """ Create a payload from the headers and content of a part.
+
+        :return: The payload, None if the part is not a base64 or
+            quoted-printable encoded text or image part.
+        :rtype:
+            :class:`spamclustering.preprocess.encodingConverter.Payload`
+        """
+        headers = dict()
+        header_block = serialized_email[header_start:header_end]
+        # unfold continuation lines before splitting the headers
+        for line in self.folded_line_re.sub(' ', header_block).split('\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        mime_type = headers.get('content-type', '').split(';')[0]
+        main_type, _, extension = mime_type.strip().lower().partition('/')
+        match (main_type, extension):
+            case ('text', 'plain'):
+                content_type = (pl.ContentType.PLAINTEXT, extension)
+            case ('text', 'html'):
+                content_type = (pl.ContentType.HTMLTEXT, extension)
+            case ('image', _) if extension:
+                content_type = (pl.ContentType.IMAGE, extension)
+            case _:
+                return None
+        match headers.get('content-transfer-encoding', '').lower():
+            case 'base64':
+                transfer_encoding = pl.Encoding.BASE64
+                # blank lines before the boundary do not belong to the
+                # base64 content
+                while (content_end - content_start > 1) and \
+                      (serialized_email[content_end - 2] == '\n'):
+                    content_end -= 1
+            case 'quoted-printable':
+                transfer_encoding = pl.Encoding.QUOTEDPRINTABLE
+            case _:
+                return None
+        return self._create_payload(
+            content_start, content_end,
+            serialized_email[content_start:content_end], content_type,
+            transfer_encoding, serialized_email[header_start:content_end])
+
+
+PAYLOAD_SCANNERS = {
+    'regex': PayloadScanner,
+    'mime': MimeWalker
+}
+"""Available payload scanners by name."""
@@ -0,0 +1,158 @@
+import json
+
+from array import array
+
+
+ITEM_TYPECODE = 'i'
+"""Typecode of :class:`array.array` used for encoded feature vectors (signed
+32 bit integer on all supported platforms)."""
+
+
+class Vocabulary:
+    """ Interns (feature, value) pairs as dense integer item IDs.
+
+    Feature vectors created by
+    :class:`spamclustering.preprocess.featureselector.FeatureSelector` are
+    dicts of (often long) strings. Clustering algorithms only compare
+    values for equality, so each (feature, value) pair can be replaced by an
+    integer ID. An encoded feature vector is an :class:`array.array` of item
+    IDs, where the ID at position i belongs to the feature features[i].
+
+    Item IDs are only meaningful together with the vocabulary that created
+    them. To encode new mails for a model learned before, e.g. a
+    :class:`spamclustering.algorithms.cctree.CCTreeModel`, keep the
+    vocabulary with :meth:`save` and :meth:`load`.
+
+    :param features: Order of features in encoded vectors. If None, the key
+        order of the first encoded feature vector is used.
+    :type features: list of str
+    """
+    def __init__(self, features=None):
+        self.features = list(features) if features is not None else None
+        self.item_ids = dict()
+        self.items = []
+
+    def intern(self, feature, value):
+        """ Return the ID of a (feature, value) pair, create it if unknown.
+
+        :param feature: Name of the feature.
+        :type feature: str
+        :param value: Value of the feature.
+        :type value: str
+        :return: Dense integer ID of the pair.
+        :rtype: int
+        """
+        key = (feature, value)
+        item_id = self.item_ids.get(key)
+        if item_id is None:
+            item_id = len(self.items)
+            self.item_ids[key] = item_id
+            self.items.append(key)
+        return item_id
+
+    def encode(self, feature_vector):
+        """ Encode a feature vector as array of item IDs.
+
+        :param feature_vector: Feature vector to encode.
+        :type feature_vector: dict of features and their respective values.
+        :return: Item IDs ordered like self.features.
+        :rtype: :class:`array.array` of int
+        """
+        if self.features is None:
+            self.features = list(feature_vector.keys())
+        return array(ITEM_TYPECODE,
+                     [self.intern(feature, feature_vector[feature])
+                      for feature in self.features])
+
+    def encode_feature_dict(self, feature_dict):
+        """ Encode all feature vectors of a feature dict.
+
+        :param feature_dict: dict of mail IDs and their respective feature.
+        :type feature_dict: dict
+        :return: dict of mail IDs and their encoded feature vector.
+        :rtype: dict of str and :class:`array.array`
+        """
+        return {mail_id: self.encode(feature_vector)
+                for mail_id, feature_vector in feature_dict.items()}
+
+    def decode(self, encoded_vector):
+        """ Restore the feature vector of an encoded feature vector.
+
+        :param encoded_vector: Item IDs as returned by :meth:`encode`.
+        :type encoded_vector: :class:`array.array` of int
+        :return: Feature vector.
+        :rtype: dict of features and their respective values.
+        """
+        result = dict()
+        for item_id in encoded_vector:
+            feature, value = self.items[item_id]
+            result[feature] = value
+        return result
+
+    def to_json(self):
+        """ Return the vocabulary as JSON serializable dict.
+
+        :return: Feature order and (feature, value) pair of each item ID.
+        :rtype: dict
+        """
+        return {'features': self.features,
+                'items': [list(item) for item in self.items]}
+
+    @staticmethod
+    def from_json(stored):
+        """ Restore a vocabulary returned by :meth:`to_json`.
+
+        :param stored: The stored vocabulary.
+        :type stored: dict
+        :return: The vocabulary, which creates the same item IDs.
+        :rtype: :class:`spamclustering.preprocess.vocabulary.Vocabulary`
+        """
+        result = Vocabulary(stored['features'])
+        for feature, value in stored['items']:
+            result.intern(feature, value)
+        return result
+
+    def save(self, path):
+        """ Write the vocabulary to a JSON file.
+
+        Feature values have to be JSON serializable, which the categorical
+        features of
+        :class:`spamclustering.preprocess.featureselector.FeatureSelector`
+        are.
+
+        :param path: Path of the file to write.
+        :type path: str
+        """
+        with open(path, 'w') as fp:
+            json.dump(self.to_json(), fp)
+
+    @staticmethod
+    def load(path):
+        """ Read a vocabulary written by :meth:`save`.
+
+        :param path: Path of the file to read.
+        :type path: str
+        :return: The loaded vocabulary.
+        :rtype: :class:`spamclustering.preprocess.vocabulary.Vocabulary`
+        """
+        with open(path, 'r') as fp:
+            return Vocabulary.from_json(json.load(fp))
+
+    def __len__(self):
+        return len(self.items)
+
+
+def feature_values(feature_vector):
+    """ Return the items of a feature vector.
+
+    Algorithms working on items use this function so they accept both plain
+    feature vectors and feature vectors encoded by :class:`Vocabulary`.
+
+    :param feature_vector: Plain or encoded feature vector.
+    :type feature_vector: dict or :class:`array.array` of int
+    :return: Values of a plain feature vector, item IDs of an encoded one.
+    :rtype: iterable
+    """
+    if isinstance(feature_vector, dict):
+        return feature_vector.values()
+    return feature_vector